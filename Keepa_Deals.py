@@ -1,12 +1,21 @@
 # Keepa_Deals.py force change window
 # Chunk 1 starts
-import json, csv, logging, sys, requests, urllib.parse, time
-from retrying import retry
-from stable_deals import validate_asin, fetch_deals_for_deals
-from field_mappings import FUNCTION_LIST
-
-# Logging
-logging.basicConfig(filename='debug_log.txt', level=logging.DEBUG, format='%(asctime)s %(levelname)s: %(message)s')
+import json, csv, logging, os, sys, urllib.parse, time, asyncio
+from stable_deals import validate_asin, iter_deals
+from token_scheduler import scheduler, estimate_product_cost
+from keepa_session import get_session
+import product_cache
+from product_cache import params_key
+from run_state import RunState
+from deal_store import open_store
+from stats_batch import BATCH_FUNCS
+from field_mappings import compile_plan, extract_row
+import row_pool
+from row_pool import compute_rows, plan_headers, record_type, release_payload
+from buy_box_fallback import patch_rows
+from log_setup import configure_logging, set_trace_asin
+from metrics import metrics, peak_rss_mb
+from column_formats import format_rows
 
 # Cache config and headers
 try:
@@ -14,12 +23,32 @@ try:
         config = json.load(f)
         api_key = config['api_key']
         print(f"API key loaded: {api_key[:5]}...")
+    # Logging: "debug" keeps the full per-ASIN trace, "production" logs INFO and up only
+    configure_logging(
+        mode=config.get('log_mode', 'debug'),
+        sample_rate=float(config.get('log_debug_sample_rate', 1.0)),
+        max_bytes=int(config.get('log_max_bytes', 50 * 1024 * 1024)),
+        backup_count=int(config.get('log_backup_count', 3)),
+    )
     with open('headers.json') as f:
         HEADERS = json.load(f)
-        logging.debug(f"Loaded headers: {len(HEADERS)} fields")
+        logging.debug("Loaded headers: %s fields", len(HEADERS))
         print(f"Headers loaded: {len(HEADERS)} fields")
+    PLAN = compile_plan(HEADERS)
+    BATCH_STATS = bool(config.get('batch_stats', False))
+    ROW_PLAN = compile_plan(HEADERS, exclude=BATCH_FUNCS) if BATCH_STATS else PLAN
+    # Memory-lean mode: product payloads are dropped once their row is built, kept rows are
+    # compact tuple records instead of dicts, and fewer rows/batches are buffered
+    MEMORY_LEAN = bool(config.get('memory_lean', False))
+    FILLED_HEADERS = plan_headers(HEADERS, PLAN)
+    ROW_RECORD = record_type(FILLED_HEADERS) if MEMORY_LEAN else None
+    # Headers no column function fills are '-' in every row; reported once here, not per row
+    filled = set(FILLED_HEADERS)
+    UNFILLED_HEADERS = [header for header in HEADERS if header not in filled]
+    if UNFILLED_HEADERS:
+        logging.warning("%s headers have no column function and stay '-': %s", len(UNFILLED_HEADERS), UNFILLED_HEADERS)
 except Exception as e:
-    logging.error(f"Startup failed: {str(e)}")
+    logging.error("Startup failed: %s", e)
     print(f"Startup failed: {str(e)}")
     sys.exit(1)
 # Chunk 1 ends
@@ -30,127 +59,481 @@ except Exception as e:
 # 2025-05-22: Switched to Python client, offers=100 (commit 69d2801d).
 # 2025-05-22: Reverted to HTTP, offers=100, added Python client fallback (commit e1f6f52e).
 # 2025-05-22: Increased timeout=60, wait_fixed=10000, sleep=2 to fix timeouts for ASINs 1848638930, B0CS6RL7D6, B0C1VSRNNH.
-@retry(stop_max_attempt_number=3, wait_fixed=10000)
-def fetch_product(asin, days=365, offers=100, rating=1, history=1):
-    if not validate_asin(asin):
-        logging.error(f"Invalid ASIN format: {asin}")
-        print(f"Invalid ASIN format: {asin}")
-        return {'stats': {'current': [-1] * 30}, 'asin': asin}
-    logging.debug(f"Fetching ASIN {asin} for {days} days, history={history}, offers={offers}...")
-    print(f"Fetching ASIN {asin}...")
-    url = f"https://api.keepa.com/product?key={api_key}&domain=1&asin={asin}&stats={days}&offers={offers}&rating={rating}&stock=1&history={history}"
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/90.0.4430.212'}
+# 2026-10-17: Added fetch_products to batch up to 100 ASINs per /product call; fetch_product now wraps it.
+# 2026-10-17: Replaced sleep=2 with the shared token scheduler (token_scheduler.py); 429s wait for the refill and retry.
+# 2026-10-17: Requests go through the pooled keep-alive session in keepa_session.py (headers come from API_HEADERS).
+# 2026-10-17: Cached products (product_cache.py) are served without a request unless the deal's lastUpdate is newer.
+# 2026-10-18: Dropped @retry: failures are handled in the attempt loop and come back as empty products, so it never fired.
+PRODUCT_BATCH_SIZE = min(int(config.get('product_batch_size', 100)), 100)
+
+def empty_product(asin):
+    return {'stats': {'current': [-1] * 30}, 'asin': asin, 'fetchFailed': True}
+
+def fetch_products(asins, days=365, offers=100, rating=1, history=1, deal_updates=None):
+    products_by_asin = {}
+    valid_asins = []
+    for asin in asins:
+        if not validate_asin(asin):
+            logging.error("Invalid ASIN format: %s", asin)
+            print(f"Invalid ASIN format: {asin}")
+            products_by_asin[asin] = empty_product(asin)
+        elif asin not in valid_asins:
+            valid_asins.append(asin)
+    cache_key = params_key(days=days, offers=offers, rating=rating, stock=1, history=history)
+    if product_cache.cache is not None and valid_asins:
+        cached = product_cache.cache.get_many(valid_asins, cache_key, deal_updates)
+        products_by_asin.update(cached)
+        valid_asins = [asin for asin in valid_asins if asin not in cached]
+        logging.debug("Product cache: %s hits, %s misses", len(cached), len(valid_asins))
+    if not valid_asins:
+        return products_by_asin
+    logging.debug("Fetching %s ASINs for %s days, history=%s, offers=%s...", len(valid_asins), days, history, offers)
+    print(f"Fetching {len(valid_asins)} ASINs ({valid_asins[0]}...)")
+    url = f"https://api.keepa.com/product?key={api_key}&domain=1&asin={','.join(valid_asins)}&stats={days}&offers={offers}&rating={rating}&stock=1&history={history}"
+    cost = estimate_product_cost(len(valid_asins), offers=offers, rating=rating, stock=1)
     try:
-        response = requests.get(url, headers=headers, timeout=60)
-        logging.debug(f"Response status: {response.status_code}")
+        for attempt in range(3):
+            scheduler.acquire(cost)
+            start = time.perf_counter()
+            response = get_session().get(url, timeout=60)
+            fetch_seconds = time.perf_counter() - start
+            logging.debug("Response status: %s", response.status_code)
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            scheduler.update(data)
+            metrics.record('product fetch', fetch_seconds, asins=len(valid_asins), bytes=len(response.content), tokens=data.get('tokensConsumed', 0) or 0)
+            if response.status_code != 429:
+                break
+            logging.warning("Token limit hit fetching %s ASINs (attempt %s), waiting for refill", len(valid_asins), attempt+1)
         if response.status_code != 200:
-            logging.error(f"Request failed: {response.status_code}, {response.text}")
+            logging.error("Request failed: %s, %s", response.status_code, response.text)
             print(f"Request failed: {response.status_code}")
-            return {'stats': {'current': [-1] * 30}, 'asin': asin}
-        data = response.json()
-        products = data.get('products', [])
-        if not products:
-            logging.error(f"No product data for ASIN {asin}")
-            print(f"No product data for ASIN {asin}")
-            return {'stats': {'current': [-1] * 30}, 'asin': asin}
-        product = products[0]
-        stats = product.get('stats', {})
-        current = stats.get('current', [-1] * 30)
-        offers = product.get('offers', []) if product.get('offers') is not None else []
-        logging.debug(f"HTTP Stats for ASIN {asin}: keys={list(stats.keys())}, current={current}, offers_count={len(offers)}")
-        time.sleep(2)  # Mitigate server delays
-        return product
+            products = []
+        else:
+            products = data.get('products', []) or []
+        for product in products:
+            asin = product.get('asin')
+            if asin not in valid_asins:
+                logging.warning("Unexpected ASIN in product response: %s", asin)
+                continue
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                set_trace_asin(asin)
+                stats = product.get('stats') or {}
+                logging.debug("HTTP Stats for ASIN %s: keys=%s, current=%s, offers_count=%s", asin, list(stats.keys()), stats.get('current', [-1] * 30), len(product.get('offers') or []))
+            products_by_asin[asin] = product
+        if product_cache.cache is not None:
+            product_cache.cache.put_many({asin: products_by_asin[asin] for asin in valid_asins if asin in products_by_asin}, cache_key)
+        for asin in valid_asins:
+            if asin not in products_by_asin:
+                logging.error("No product data for ASIN %s", asin)
+                print(f"No product data for ASIN {asin}")
+                products_by_asin[asin] = empty_product(asin)
+        return products_by_asin
     except Exception as e:
-        logging.error(f"HTTP Fetch failed for ASIN {asin}: {str(e)}")
+        logging.error("HTTP Fetch failed for ASINs %s: %s", valid_asins, e)
         print(f"HTTP Fetch failed: {str(e)}")
-        return {'stats': {'current': [-1] * 30}, 'asin': asin}
+        for asin in valid_asins:
+            products_by_asin.setdefault(asin, empty_product(asin))
+        return products_by_asin
+
+def fetch_product(asin, days=365, offers=100, rating=1, history=1):
+    return fetch_products([asin], days=days, offers=offers, rating=rating, history=history).get(asin, empty_product(asin))
 # Chunk 2 ends
 
 # Chunk 3 starts
-def write_csv(rows, deals, diagnostic=False):
+# 2026-10-17: write_csv replaced by a streaming sink. Rows are written as soon as they are built,
+# paired with their ASIN (the old deals[:len(rows)] zip misaligned whenever a deal was skipped),
+# into Keepa_Deals_Export.csv.tmp, which replaces the export only after a clean finish.
+# 2026-10-18: The per-row missing-headers warning is gone; unfilled headers are logged once at startup.
+EXPORT_PATH = 'Keepa_Deals_Export.csv'
+CSV_FLUSH_ROWS = max(int(config.get('csv_flush_rows', 500)), 1)
+PARQUET_EXPORT = bool(config.get('parquet_export', False))
+PARQUET_PATH = config.get('parquet_path', 'Keepa_Deals_Export.parquet')
+PARQUET_ROW_GROUP_SIZE = max(int(config.get('parquet_row_group_size', 10000)), 1)
+if MEMORY_LEAN:
+    PARQUET_ROW_GROUP_SIZE = min(PARQUET_ROW_GROUP_SIZE, 2000)
+
+def open_parquet_sink(headers):
+    # Typed copy of the export next to the CSV; needs pyarrow, which is optional
     try:
-        with open('Keepa_Deals_Export.csv', 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(HEADERS)
-            if diagnostic:
-                writer.writerow(['No deals fetched'] + ['-'] * (len(HEADERS) - 1))
-                logging.info(f"Diagnostic CSV written: Keepa_Deals_Export.csv")
-                print(f"Diagnostic CSV written: Keepa_Deals_Export.csv")
-            else:
-                for deal, row in zip(deals[:len(rows)], rows):
-                    try:
-                        row_data = row.copy()
-                        missing_headers = [h for h in HEADERS if h not in row_data]
-                        if missing_headers:
-                            logging.warning(f"Missing headers for ASIN {deal.get('asin', '-')}: {missing_headers[:5]}")
-                        logging.debug(f"row_data for ASIN {deal.get('asin', '-')}: {list(row_data.keys())[:10]}")
-                        print(f"Writing row for ASIN {deal.get('asin', '-')}...")
-                        writer.writerow([row_data.get(header, '-') for header in HEADERS])
-                        logging.debug(f"Wrote row for ASIN {deal.get('asin', '-')}")
-                    except Exception as e:
-                        logging.error(f"Failed to write row for ASIN {deal.get('asin', '-')}: {str(e)}")
-                        print(f"Failed to write row for ASIN {deal.get('asin', '-')}: {str(e)}")
-        logging.info(f"CSV written: Keepa_Deals_Export.csv")
-        print(f"CSV written: Keepa_Deals_Export.csv")
-    except Exception as e:
-        logging.error(f"Failed to write CSV Keepa_Deals_Export.csv: {str(e)}")
-        print(f"Failed to write CSV Keepa_Deals_Export.csv: {str(e)}")
+        from parquet_export import ParquetSink
+        return ParquetSink(PARQUET_PATH, headers, PARQUET_ROW_GROUP_SIZE)
+    except ImportError as e:
+        logging.error("Parquet export disabled, pyarrow not available: %s", e)
+        print("Parquet export disabled: pip install pyarrow")
+        return None
+
+class CsvSink:
+    def __init__(self, path=EXPORT_PATH, headers=HEADERS, flush_rows=CSV_FLUSH_ROWS):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.headers = headers
+        self.flush_rows = flush_rows
+        self.written = 0
+        self.asins = set()
+        self._file = open(self.tmp_path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(headers)
+        self.parquet = open_parquet_sink(headers) if PARQUET_EXPORT else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+    def write_rows(self, rows):
+        # rows: [(asin, raw row dict)]; one row per ASIN, the first one wins. The batch is
+        # formatted for display in one pass; Parquet gets the raw values.
+        start = time.perf_counter()
+        batch = []
+        for asin, row in rows:
+            if asin in self.asins:
+                logging.warning("Duplicate ASIN %s, keeping the first row", asin)
+                continue
+            self.asins.add(asin)
+            batch.append(row)
+        for values in format_rows(batch, self.headers):
+            self._writer.writerow(values)
+            self.written += 1
+            if self.written % self.flush_rows == 0:
+                self._file.flush()
+        if self.parquet is not None:
+            for row in batch:
+                self.parquet.add([row.get(header) for header in self.headers])
+        metrics.record('csv write', time.perf_counter() - start, rows=len(batch))
+
+    def write(self, asin, row):
+        self.write_rows(((asin, row),))
+
+    def write_diagnostic(self):
+        self._writer.writerow(['No deals fetched'] + ['-'] * (len(self.headers) - 1))
+        logging.info("Diagnostic CSV written: %s", self.path)
+        print(f"Diagnostic CSV written: {self.path}")
+
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        logging.info("CSV written: %s (%s rows)", self.path, self.written)
+        print(f"CSV written: {self.path} ({self.written} rows)")
+        if self.parquet is not None:
+            with metrics.timer('parquet write'):
+                self.parquet.commit()
+
+    def abort(self):
+        # The previous export stays in place; the partial temp file is dropped
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+        if self.parquet is not None:
+            self.parquet.abort()
+        logging.error("CSV export aborted, %s left unchanged", self.path)
+        print(f"CSV export aborted, {self.path} left unchanged")
 # Chunk 3 ends
 
 # Chunk 4 starts
+PIPELINE_MODE = config.get('pipeline', 'serial')
+MAX_DEAL_PAGES = int(config.get('max_deal_pages', 0))  # 0 = until Keepa runs out of deals
+MAX_DEALS = int(config.get('max_deals', 0))
+INCREMENTAL = bool(config.get('incremental', False))
+RUN_STATE_PATH = config.get('run_state_path', 'run_state.json')
+RUN_METRICS_PATH = config.get('run_metrics_path', 'run_metrics.json')
+ROW_WORKERS = max(int(config.get('row_workers', 0)), 0)  # 0 = build rows in this process
+ROW_CHUNK_SIZE = max(int(config.get('row_chunk_size', 0)), 0)  # 0 = each batch split evenly across the workers
+BUY_BOX_USED_FALLBACK = bool(config.get('buy_box_used_fallback', True))
+
+def build_row(deal, product):
+    return extract_row(PLAN, deal, product)
+
+# Builds (asin, row) for (deal, product) pairs; in batch_stats mode the stats columns for the
+# whole batch come from stats_batch and only the remaining extractors run per product.
+# 2026-10-17: The computation moved to row_pool.compute_rows; with "row_workers" set it runs in
+# worker processes and falls back to this process if the pool breaks.
+# 2026-10-17: In memory-lean mode rows come back as ROW_RECORD tuples and payloads are released.
+# 2026-10-17: Empty Buy Box Used cells are re-queried for the whole batch at once (buy_box_fallback.py).
+# 2026-10-18: Payloads are also released when the rows came from the worker pool, which only
+# ever saw pickled copies of the products.
+def build_rows(pairs, state=None, store=None):
+    start = time.perf_counter()
+    results = None
+    if row_pool.pool is not None and pairs:
+        try:
+            results = row_pool.pool.compute(pairs)
+        except Exception as e:
+            logging.error("Row pool failed, building %s rows in process: %s", len(pairs), e)
+    if results is None:
+        results = compute_rows(pairs, PLAN, ROW_PLAN, BATCH_STATS, release=MEMORY_LEAN)
+    if BUY_BOX_USED_FALLBACK:
+        patch_rows(pairs, results)
+    if MEMORY_LEAN:
+        for _, product in pairs:
+            release_payload(product)
+    rows = []
+    for (deal, product), row in zip(pairs, results):
+        if row is None:
+            continue
+        if ROW_RECORD is not None and isinstance(row, dict):
+            row = ROW_RECORD.from_dict(row)
+        rows.append((deal['asin'], row))
+        if state is not None and not product.get('fetchFailed'):
+            state.record(deal, row)
+        if store is not None:
+            store.add(deal, row)
+    metrics.record('row building', time.perf_counter() - start, rows=len(rows))
+    return rows
+
+def product_pairs(batch, products):
+    pairs = []
+    for deal in batch:
+        product = products.get(deal['asin'])
+        if not product or 'stats' not in product:
+            logging.error("Incomplete product data for ASIN %s", deal['asin'])
+            continue
+        pairs.append((deal, product))
+    return pairs
+
+def process_batch(batch, state=None, store=None):
+    logging.info("Fetching %s ASINs", len(batch))
+    products = fetch_products([d['asin'] for d in batch], deal_updates={d['asin']: d.get('lastUpdate') for d in batch})
+    return build_rows(product_pairs(batch, products), state, store)
+
+def finish_store(store, deal_count, row_count):
+    # Deal history (deal_store.py): flush the last batch and record the run
+    if store is None:
+        return
+    store.finish(deal_count, row_count)
+    store.close()
+    print(f"Deal store: {store.stored} rows saved to {store.path}")
+
+def abort_store(store):
+    # Failed run: nothing of it stays in the deal history
+    if store is not None:
+        store.abort()
+
+def report_metrics(deal_count, row_count, state, store=None):
+    totals = {'deals': deal_count, 'rows': row_count, 'tokens_consumed': scheduler.tokens_consumed, 'token_wait_s': round(scheduler.waited, 3)}
+    if state is not None:
+        totals['rows_reused'] = state.reused
+    if store is not None:
+        totals['rows_stored'] = store.stored
+    rss = peak_rss_mb()
+    if rss is not None:
+        totals['peak_rss_mb'] = round(rss, 1)
+    if product_cache.cache is not None:
+        totals['cache_hits'] = product_cache.cache.hits
+        totals['cache_misses'] = product_cache.cache.misses
+    metrics.report(RUN_METRICS_PATH, totals)
+
+# 2026-10-18: A failed deal page (or any other error) aborts the deal store run as well as the CSV export.
 def main():
+    store = None
     try:
         logging.info("Starting Keepa_Deals...")
         print("Starting Keepa_Deals...")
-        time.sleep(2)
-        deals = fetch_deals_for_deals(0)
-        rows = []
-        if not deals:
-            logging.warning("No deals fetched, writing diagnostic CSV")
-            print("No deals fetched, writing diagnostic CSV")
-            write_csv([], [], diagnostic=True)
+        row_pool.start(ROW_WORKERS, ROW_CHUNK_SIZE, HEADERS, PLAN, BATCH_STATS, ROW_RECORD)
+        store = open_store()
+        if PIPELINE_MODE == 'async':
+            asyncio.run(run_pipeline(store))
             return
-        logging.debug(f"Deals ASINs: {[d.get('asin', '-') for d in deals[:5]]}")
-        print(f"Deals ASINs: {[d.get('asin', '-') for d in deals[:5]]}")
-        for deal in deals:
-            asin = deal.get('asin', '-')
-            if not validate_asin(asin):
-                logging.warning(f"Skipping invalid ASIN for deal {deals.index(deal)+1}")
-                continue
-            logging.info(f"Fetching ASIN {asin} ({deals.index(deal)+1}/{len(deals)})")
-            product = fetch_product(asin)
-            if not product or 'stats' not in product:
-                logging.error(f"Incomplete product data for ASIN {asin}")
-                continue
-            row = {}
-            try:
-                # Process all functions using FUNCTION_LIST
-                for header, func in zip(HEADERS, FUNCTION_LIST):
-                    if func:
-                        try:
-                            # Pass deal for stable_deals functions, product for stable_products
-                            input_data = deal if header in ['Deal found', 'last update', 'last price change'] else product
-                            result = func(input_data)
-                            row.update(result)
-                        except Exception as e:
-                            logging.error(f"Function {func.__name__} failed for ASIN {asin}: {str(e)}")
-                            row[header] = '-'
-                rows.append(row)
-            except Exception as e:
-                logging.error(f"Error processing ASIN {asin}: {str(e)}")
-                continue
-        write_csv(rows, deals)
-        logging.info("Writing CSV...")
-        print("Writing CSV...")
+        state = RunState(RUN_STATE_PATH, ROW_RECORD) if INCREMENTAL else None
+        deal_count = 0
+        first_asins = []
+        batch = []
+        with CsvSink() as sink:
+            for deal in iter_deals(MAX_DEAL_PAGES, MAX_DEALS):
+                deal_count += 1
+                if len(first_asins) < 5:
+                    first_asins.append(deal.get('asin', '-'))
+                if not validate_asin(deal.get('asin', '-')):
+                    logging.warning("Skipping invalid ASIN for deal %s", deal_count)
+                    continue
+                if state is not None:
+                    row = state.unchanged_row(deal)
+                    if row is not None:
+                        sink.write(deal['asin'], row)
+                        if store is not None:
+                            store.add(deal, row)
+                        continue
+                batch.append(deal)
+                if len(batch) == PRODUCT_BATCH_SIZE:
+                    sink.write_rows(process_batch(batch, state, store))
+                    batch = []
+            if batch:
+                sink.write_rows(process_batch(batch, state, store))
+            if not deal_count:
+                logging.warning("No deals fetched, writing diagnostic CSV")
+                print("No deals fetched, writing diagnostic CSV")
+                sink.write_diagnostic()
+        if not deal_count:
+            return
+        finish_store(store, deal_count, sink.written)
+        logging.debug("Deals ASINs: %s", first_asins)
+        print(f"Deals ASINs: {first_asins}")
+        if state is not None:
+            state.save()
+            print(f"Incremental run: {state.reused} unchanged rows reused, {sink.written - state.reused} recomputed")
+        if product_cache.cache is not None:
+            print(f"Product cache: {product_cache.cache.hits} hits, {product_cache.cache.misses} misses")
+        report_metrics(deal_count, sink.written, state, store)
         logging.info("Script completed!")
         print("Script completed!")
-        print(f"Processed ASINs: {[row.get('ASIN', '-') for row in rows]}")
     except Exception as e:
-        logging.error(f"Main failed: {str(e)}")
+        logging.error("Main failed: %s", e)
         print(f"Main failed: {str(e)}")
+        abort_store(store)
         sys.exit(1)
+    finally:
+        row_pool.stop()
 # Chunk 4 ends
 
+# Chunk 5 starts
+# Async pipeline (config "pipeline": "async"): deal pages -> product batches -> row building -> CSV sink.
+# Stages are joined by bounded queues so a slow stage applies backpressure and memory stays flat.
+# Blocking fetches run in worker threads; all of them share the token scheduler, so the rate limit holds.
+# 2026-10-18: Batches and reused rows carry a sequence number and the CSV stage writes them in that
+# order, so the export matches a serial run even when parallel product fetches finish out of order.
+# 2026-10-18: The reorder buffer is bounded: product fetches and reused rows wait while they are
+# too far ahead of what the CSV stage has written (the oldest unwritten batch never waits).
+PIPELINE_CONCURRENCY = max(int(config.get('pipeline_concurrency', 2)), 1)
+PIPELINE_QUEUE_SIZE = 1 if MEMORY_LEAN else max(int(config.get('pipeline_queue_size', 4)), 1)
+REORDER_BATCHES = PIPELINE_CONCURRENCY + PIPELINE_QUEUE_SIZE  # Product batches in flight past the CSV
+REORDER_ROWS = PIPELINE_QUEUE_SIZE * PRODUCT_BATCH_SIZE  # Sequence numbers a reused row may run ahead
+_DONE = object()
+
+class _Progress:
+    # What the CSV stage has written; earlier stages wait on it
+    def __init__(self):
+        self.changed = asyncio.Condition()
+        self.seq = 0  # Next sequence number to write
+        self.batches = 0  # Product batches written
+
+    async def wait_until(self, predicate):
+        async with self.changed:
+            await self.changed.wait_for(predicate)
+
+async def _deal_stage(batch_queue, sink_queue, state, store, progress):
+    deals = iter_deals(MAX_DEAL_PAGES, MAX_DEALS)
+    deal_count = 0
+    seq = 0
+    batch_no = 0
+    batch = []
+    while True:
+        # Each next() may block on a page download, so it runs off the event loop
+        deal = await asyncio.to_thread(next, deals, None)
+        if deal is None:
+            break
+        deal_count += 1
+        if not validate_asin(deal.get('asin', '-')):
+            logging.warning("Skipping invalid ASIN for deal %s", deal_count)
+            continue
+        if state is not None:
+            row = state.unchanged_row(deal)
+            if row is not None:
+                await progress.wait_until(lambda: seq - progress.seq < REORDER_ROWS)
+                await sink_queue.put((seq, [(deal['asin'], row)], False))
+                seq += 1
+                if store is not None:
+                    store.add(deal, row)
+                continue
+        batch.append(deal)
+        if len(batch) == PRODUCT_BATCH_SIZE:
+            await batch_queue.put((seq, batch_no, batch))
+            seq += 1
+            batch_no += 1
+            batch = []
+    if batch:
+        await batch_queue.put((seq, batch_no, batch))
+    for _ in range(PIPELINE_CONCURRENCY):
+        await batch_queue.put(_DONE)
+    return deal_count
+
+async def _product_stage(batch_queue, row_queue, progress):
+    while True:
+        item = await batch_queue.get()
+        if item is _DONE:
+            await row_queue.put(_DONE)
+            return
+        seq, batch_no, batch = item
+        # Batches leave batch_queue in order, so the oldest unwritten one is always held by a
+        # worker that passes this check; later ones wait instead of piling up in _csv_stage
+        await progress.wait_until(lambda: batch_no - progress.batches < REORDER_BATCHES)
+        products = await asyncio.to_thread(fetch_products, [d['asin'] for d in batch], deal_updates={d['asin']: d.get('lastUpdate') for d in batch})
+        await row_queue.put((seq, product_pairs(batch, products)))
+
+async def _row_stage(row_queue, sink_queue, state, store):
+    finished = 0
+    while finished < PIPELINE_CONCURRENCY:
+        item = await row_queue.get()
+        if item is _DONE:
+            finished += 1
+            continue
+        seq, pairs = item
+        rows = await asyncio.to_thread(build_rows, pairs, state, store)
+        await sink_queue.put((seq, rows, True))
+    await sink_queue.put(_DONE)
+
+async def _csv_stage(sink_queue, sink, progress):
+    # Items are (seq, [(asin, row)], is_batch); early arrivals wait in `pending` until the gap
+    # before them fills
+    pending = {}
+    while True:
+        item = await sink_queue.get()
+        if item is _DONE:
+            return sink.written
+        seq, rows, is_batch = item
+        pending[seq] = (rows, is_batch)
+        if progress.seq not in pending:
+            continue
+        async with progress.changed:
+            while progress.seq in pending:
+                rows, is_batch = pending.pop(progress.seq)
+                sink.write_rows(rows)
+                progress.seq += 1
+                progress.batches += is_batch
+            progress.changed.notify_all()
+
+async def run_pipeline(store=None):
+    logging.info("Async pipeline: concurrency=%s, queue_size=%s", PIPELINE_CONCURRENCY, PIPELINE_QUEUE_SIZE)
+    print(f"Async pipeline: concurrency={PIPELINE_CONCURRENCY}")
+    batch_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    row_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    sink_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    progress = _Progress()
+    state = RunState(RUN_STATE_PATH, ROW_RECORD) if INCREMENTAL else None
+    with CsvSink() as sink:
+        deal_count, *_, written = await asyncio.gather(
+            _deal_stage(batch_queue, sink_queue, state, store, progress),
+            *[_product_stage(batch_queue, row_queue, progress) for _ in range(PIPELINE_CONCURRENCY)],
+            _row_stage(row_queue, sink_queue, state, store),
+            _csv_stage(sink_queue, sink, progress),
+        )
+        if not deal_count:
+            logging.warning("No deals fetched, writing diagnostic CSV")
+            print("No deals fetched, writing diagnostic CSV")
+            sink.write_diagnostic()
+    if not deal_count:
+        return
+    finish_store(store, deal_count, written)
+    if state is not None:
+        state.save()
+        print(f"Incremental run: {state.reused} unchanged rows reused, {written - state.reused} recomputed")
+    if product_cache.cache is not None:
+        print(f"Product cache: {product_cache.cache.hits} hits, {product_cache.cache.misses} misses")
+    report_metrics(deal_count, written, state, store)
+    logging.info("Script completed!")
+    print("Script completed!")
+# Chunk 5 ends
+
 if __name__ == "__main__":
     main()
 
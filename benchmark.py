@@ -0,0 +1,247 @@
+# benchmark.py
+# CPU-side benchmark of the export path: synthetic Keepa deals and products (100-offer lists,
+# full csv histories, categoryTrees) go through the same loop as main() -- product batches into
+# build_rows, rows streamed to the CSV sink -- with no API calls or tokens. Each scale runs in its own process
+# in a scratch directory so peak RSS is per scale and nothing in the project folder is touched.
+# Results are appended to benchmark_history.jsonl and compared with the last matching run.
+#   python benchmark.py                       (1k, 10k and 100k ASINs)
+#   python benchmark.py --scales 1000 --batch-stats
+#   python benchmark.py --scales 10000 --row-workers 8
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+from metrics import peak_rss_mb
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_PATH = os.path.join(PROJECT_DIR, 'benchmark_history.jsonl')
+DEFAULT_SCALES = (1000, 10000, 100000)
+KEEPA_NOW = 8100000  # ~2026-05 in Keepa minutes
+CSV_TYPES = 35
+SHIPPING_TYPES = frozenset({7, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 32})
+PRICE_TYPES = (0, 1, 2, 4, 7, 10, 18, 19, 20, 21, 22, 32)
+CONDITIONS = ('New', 'New', 'Used - Like New', 'Used - Very Good', 'Used - Good', 'Used - Acceptable')
+CATEGORY_NAMES = ('Books', 'Subjects', 'Science & Math', 'Biological Sciences', 'Biology', 'Textbooks')
+
+# Synthetic data starts
+def _series(rng, points, low, high, shipping=False, gaps=0.05):
+    # Flat Keepa csv array over the last ~3 years: [time, value, ...] or [time, price, shipping, ...]
+    times = np.sort(rng.integers(KEEPA_NOW - 3 * 525600, KEEPA_NOW, points))
+    values = rng.integers(low, high, points)
+    values[rng.random(points) < gaps] = -1
+    if shipping:
+        return np.column_stack((times, values, rng.choice([0, 0, 399], points))).ravel().tolist()
+    return np.column_stack((times, values)).ravel().tolist()
+
+def _stat_entry(rng, low, high):
+    return [int(rng.integers(KEEPA_NOW - 525600, KEEPA_NOW)), int(rng.integers(low, high))]
+
+def synthetic_product(asin, rng):
+    csv_data = [None] * CSV_TYPES
+    for index in PRICE_TYPES:
+        if rng.random() < 0.85:
+            csv_data[index] = _series(rng, int(rng.integers(200, 1500)), 500, 30000, index in SHIPPING_TYPES)
+    csv_data[3] = _series(rng, int(rng.integers(1000, 3000)), 50000, 1500000, gaps=0.0)
+    for index in (11, 12):
+        csv_data[index] = _series(rng, int(rng.integers(100, 600)), 0, 60, gaps=0.0)
+    csv_data[16] = _series(rng, 50, 30, 50, gaps=0.0)
+    csv_data[17] = _series(rng, 50, 0, 2000, gaps=0.0)
+
+    def stat_array(low=500, high=30000):
+        values = rng.integers(low, high, CSV_TYPES)
+        values[rng.random(CSV_TYPES) < 0.15] = -1
+        values[3] = rng.integers(50000, 1500000)
+        values[9] = rng.integers(low, high)  # Buy Box Used is always set so the keepa client fallback never runs
+        return values.tolist()
+
+    stats = {key: stat_array() for key in ('current', 'avg', 'avg30', 'avg90', 'avg180', 'avg365', 'atIntervalStart')}
+    for key in ('min', 'max', 'minInInterval', 'maxInInterval'):
+        stats[key] = [_stat_entry(rng, 500, 30000) if rng.random() > 0.15 else None for _ in range(CSV_TYPES)]
+    for key in ('outOfStockPercentage30', 'outOfStockPercentage90', 'outOfStockPercentageInInterval'):
+        stats[key] = rng.integers(0, 101, CSV_TYPES).tolist()
+    for days in (30, 90, 180, 365):
+        stats[f'salesRankDrops{days}'] = int(rng.integers(0, days))
+    stats.update(totalOfferCount=100, buyBoxPrice=int(rng.integers(500, 30000)), buyBoxIsFBA=bool(rng.random() < 0.5), lastOffersUpdate=KEEPA_NOW - 60)
+
+    offers = []
+    for i in range(100):
+        price = int(rng.integers(500, 30000))
+        offers.append({
+            'offerId': i, 'sellerId': f"A{int(rng.integers(10**12, 10**13))}", 'lastSeen': KEEPA_NOW - int(rng.integers(0, 10000)),
+            'condition': CONDITIONS[int(rng.integers(0, len(CONDITIONS)))], 'price': price, 'stock': int(rng.integers(0, 30)),
+            'isFBA': bool(rng.random() < 0.4), 'isPrime': bool(rng.random() < 0.4), 'isAmazon': False, 'isShippable': True,
+            'isMAP': False, 'isPreorder': False, 'isWarehouseDeal': False, 'isScam': False, 'conditionComment': None,
+            'offerCSV': _series(rng, 20, 500, 30000, shipping=True, gaps=0.0),
+        })
+    depth = int(rng.integers(3, 6))
+    return {
+        'asin': asin, 'domainId': 1, 'title': f"Synthetic Title {asin} " + 'x' * int(rng.integers(10, 120)),
+        'manufacturer': 'Synthetic Press', 'author': 'A. Writer', 'binding': 'Paperback', 'productGroup': 'Book',
+        'rootCategory': 283155, 'categories': [int(rng.integers(1000, 999999))],
+        'categoryTree': [{'catId': 283155 + level, 'name': CATEGORY_NAMES[level]} for level in range(depth)],
+        'trackingSince': KEEPA_NOW - int(rng.integers(525600, 5 * 525600)), 'listedSince': KEEPA_NOW - int(rng.integers(525600, 6 * 525600)),
+        'lastUpdate': KEEPA_NOW - int(rng.integers(0, 600)), 'lastPriceChange': KEEPA_NOW - int(rng.integers(0, 6000)),
+        'packageHeight': 25, 'packageLength': 229, 'packageWidth': 152, 'packageWeight': 340, 'packageQuantity': 1,
+        'csv': csv_data, 'stats': stats, 'offers': offers, 'liveOffersOrder': list(range(100)),
+    }
+
+def synthetic_deal(asin, rng):
+    current = rng.integers(500, 30000, CSV_TYPES).tolist()
+    return {
+        'asin': asin, 'title': f"Synthetic Title {asin}", 'rootCat': 283155, 'categories': [283155],
+        'creationDate': KEEPA_NOW - int(rng.integers(0, 4320)), 'lastUpdate': KEEPA_NOW - int(rng.integers(0, 600)),
+        'currentSince': (KEEPA_NOW - rng.integers(0, 20000, CSV_TYPES)).tolist(), 'current': current,
+        'delta': [rng.integers(-5000, 5000, CSV_TYPES).tolist() for _ in range(4)],
+        'deltaPercent': [rng.integers(-100, 100, CSV_TYPES).tolist() for _ in range(4)],
+        'avg': [rng.integers(500, 30000, CSV_TYPES).tolist() for _ in range(4)],
+    }
+
+def synthetic_batches(count, batch_size, seed=0):
+    # Yields (deals, {asin: product}) per product batch, generated on the fly to keep memory flat
+    for start in range(0, count, batch_size):
+        deals = []
+        products = {}
+        for i in range(start, min(start + batch_size, count)):
+            rng = np.random.default_rng([seed, i])
+            asin = f"B{i:09d}"
+            deals.append(synthetic_deal(asin, rng))
+            products[asin] = synthetic_product(asin, rng)
+        yield deals, products
+# Synthetic data ends
+
+def _mb(value):
+    return 'n/a' if value is None else f"{value:.0f} MB"
+
+def run_scale(count, seed):
+    # Runs inside the scratch directory; imports the project the way a real run loads it
+    sys.path.insert(0, PROJECT_DIR)
+    import Keepa_Deals
+    import row_pool
+    from metrics import metrics
+    row_pool.start(Keepa_Deals.ROW_WORKERS, Keepa_Deals.ROW_CHUNK_SIZE, Keepa_Deals.HEADERS, Keepa_Deals.PLAN, Keepa_Deals.BATCH_STATS)
+    rss_start = peak_rss_mb()
+    generate = 0.0
+    build = 0.0
+    write = 0.0
+    started = time.perf_counter()
+    batches = synthetic_batches(count, Keepa_Deals.PRODUCT_BATCH_SIZE, seed)
+    with Keepa_Deals.CsvSink() as sink:
+        while True:
+            t0 = time.perf_counter()
+            batch = next(batches, None)
+            generate += time.perf_counter() - t0
+            if batch is None:
+                break
+            batch_deals, products = batch
+            t0 = time.perf_counter()
+            rows = Keepa_Deals.build_rows(Keepa_Deals.product_pairs(batch_deals, products))
+            t1 = time.perf_counter()
+            sink.write_rows(rows)
+            build += t1 - t0
+            write += time.perf_counter() - t1
+        t0 = time.perf_counter()
+    write += time.perf_counter() - t0
+    total = time.perf_counter() - started - generate
+    row_pool.stop()
+    columns = metrics.summary()['fields']
+    return {
+        'asins': count,
+        'rows': sink.written,
+        'rows_per_s': round(sink.written / total, 1) if total else None,
+        'build_s': round(build, 3),
+        'csv_s': round(write, 3),
+        'total_s': round(total, 3),
+        'generate_s': round(generate, 3),
+        'csv_mb': round(os.path.getsize('Keepa_Deals_Export.csv') / 2**20, 2),
+        'rss_start_mb': rss_start,
+        'peak_rss_mb': peak_rss_mb(),
+        'columns': {name: {'total_s': s['total_s'], 'p50_ms': s['p50_ms'], 'p99_ms': s['p99_ms']} for name, s in columns.items()},
+    }
+
+def scratch_config(args):
+    # The project's config.json options, minus anything that would touch the network or its files
+    config = {}
+    try:
+        with open(os.path.join(PROJECT_DIR, 'config.json')) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        pass
+    config.update(api_key='benchmark', product_cache=False, incremental=False, pipeline='serial', log_mode=args.log_mode)
+    config.pop('keepa_record_dir', None)
+    if args.batch_stats is not None:
+        config['batch_stats'] = args.batch_stats
+    if args.row_workers is not None:
+        config['row_workers'] = args.row_workers
+    return config
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def previous_result(scale, options):
+    last = None
+    try:
+        with open(HISTORY_PATH, encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry.get('asins') == scale and entry.get('options') == options:
+                    last = entry
+    except (OSError, ValueError):
+        pass
+    return last
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic benchmark of row building and CSV export')
+    parser.add_argument('--scales', type=lambda text: [int(n) for n in text.split(',')], default=list(DEFAULT_SCALES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-mode', default='production', choices=('production', 'debug'))
+    parser.add_argument('--batch-stats', action='store_true', default=None)
+    parser.add_argument('--row-workers', type=int, help='worker processes for row building (peak RSS covers the main process only)')
+    parser.add_argument('--label', default='', help='note stored with the results, e.g. "before csv streaming"')
+    parser.add_argument('--no-history', action='store_true')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_scale(args.worker, args.seed)))
+        return
+
+    config = scratch_config(args)
+    options = {'batch_stats': bool(config.get('batch_stats', False)), 'log_mode': config['log_mode'], 'product_batch_size': min(int(config.get('product_batch_size', 100)), 100)}
+    if int(config.get('row_workers', 0)):
+        options['row_workers'] = int(config['row_workers'])
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory(prefix='keepa_bench_') as scratch:
+            with open(os.path.join(scratch, 'config.json'), 'w') as f:
+                json.dump(config, f)
+            shutil.copy(os.path.join(PROJECT_DIR, 'headers.json'), scratch)
+            print(f"Benchmark: {scale} ASINs ({options})...")
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', str(scale), '--seed', str(args.seed)],
+                                  cwd=scratch, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"Benchmark failed for {scale} ASINs:\n{proc.stderr[-2000:]}")
+                sys.exit(1)
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+        entry = {'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': git_commit(), 'label': args.label,
+                 'python': sys.version.split()[0], 'options': options, **result}
+        last = previous_result(scale, options)
+        print(f"  {result['rows_per_s']} rows/s, build {result['build_s']}s, csv {result['csv_s']}s, peak RSS {_mb(result['peak_rss_mb'])}")
+        if last:
+            change = (result['rows_per_s'] / last['rows_per_s'] - 1) * 100 if last.get('rows_per_s') else 0
+            print(f"  vs {last['commit']} {last['timestamp']} {last['label']}: {last['rows_per_s']} rows/s ({change:+.1f}%), peak RSS {_mb(last.get('peak_rss_mb'))}")
+        slowest = sorted(result['columns'].items(), key=lambda item: item[1]['total_s'], reverse=True)[:5]
+        print('  slowest columns: ' + ', '.join(f"{name} {s['total_s']:.2f}s" for name, s in slowest))
+        if not args.no_history:
+            with open(HISTORY_PATH, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+if __name__ == "__main__":
+    main()
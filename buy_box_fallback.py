@@ -0,0 +1,83 @@
+# buy_box_fallback.py
+# Deferred keepa-client fallback for Buy Box Used - Current. buy_box_used_current only reads the
+# HTTP product; build_rows then hands the whole batch to patch_rows, which collects the rows left
+# empty, re-queries those ASINs through the shared keepa client (up to 100 per request, cached
+# like the HTTP products) and fills the cells before the rows are exported.
+import logging
+import time
+import product_cache
+from product_cache import params_key
+from keepa_session import get_keepa_client
+from metrics import metrics
+from stable_deals import MISSING
+from token_scheduler import scheduler, estimate_product_cost
+
+HEADER = 'Buy Box Used - Current'
+QUERY = {'stats': 90, 'domain': 'US', 'history': True, 'offers': 100}
+CACHE_KEY = params_key(client='keepa', stats=90, history=1, offers=100)
+MAX_ASINS = 100  # Keepa's /product limit
+# Keys the keepa client adds to the raw JSON when it parses a product: 'data' holds numpy arrays and
+# 'stats_parsed' datetimes, neither JSON-serializable, so they are dropped before caching
+CLIENT_KEYS = ('data', 'stats_parsed')
+
+def buy_box_used_value(product):
+    # stats.current[9] in cents, MISSING when Keepa has none
+    current = (product.get('stats') or {}).get('current') or []
+    value = current[9] if len(current) > 9 else -1
+    return value if value is not None and value > 0 else MISSING
+
+def raw_product(product):
+    return {k: v for k, v in product.items() if k not in CLIENT_KEYS}
+
+def fetch_products(asins, min_ts):
+    # {asin: client product} for the ASINs Keepa returned; min_ts: ASIN -> HTTP product lastUpdate,
+    # so cached client responses older than the HTTP product are refetched
+    found = product_cache.cache.get_many(asins, CACHE_KEY, min_ts) if product_cache.cache is not None else {}
+    missing = [asin for asin in asins if asin not in found]
+    if missing:
+        api = get_keepa_client()
+        for i in range(0, len(missing), MAX_ASINS):
+            chunk = missing[i:i + MAX_ASINS]
+            scheduler.acquire(estimate_product_cost(len(chunk), offers=QUERY['offers']))
+            start = time.perf_counter()
+            try:
+                products = api.query(chunk, product_code_is_asin=True, progress_bar=False, **QUERY)
+            except Exception as e:
+                # One bad response (e.g. a client parse error) only costs its own chunk
+                logging.error("Buy Box Used fallback query failed for %s ASINs (%s...): %s", len(chunk), chunk[0], e)
+                continue
+            metrics.record('buy box used fallback', time.perf_counter() - start, asins=len(chunk))
+            scheduler.update_from_client(api)
+            fetched = {p['asin']: raw_product(p) for p in products or [] if p and p.get('asin') in chunk}
+            if fetched and product_cache.cache is not None:
+                product_cache.cache.put_many(fetched, CACHE_KEY)
+            found.update(fetched)
+    return found
+
+def patch_rows(pairs, rows):
+    # pairs: [(deal, product)], rows: matching row dicts/records (None for failed rows), patched in place
+    todo = {}
+    min_ts = {}
+    for (deal, product), row in zip(pairs, rows):
+        if row is not None and HEADER in row and row[HEADER] is MISSING:
+            todo.setdefault(deal['asin'], []).append(row)
+            min_ts[deal['asin']] = product.get('lastUpdate')
+    if not todo:
+        return 0
+    logging.info("Buy Box Used fallback for %s ASINs", len(todo))
+    try:
+        products = fetch_products(list(todo), min_ts)
+    except Exception as e:
+        logging.error("Buy Box Used fallback failed for %s ASINs: %s", len(todo), e)
+        return 0
+    patched = 0
+    for asin, asin_rows in todo.items():
+        value = buy_box_used_value(products.get(asin) or {})
+        logging.debug("Buy Box Used - Current fallback value for ASIN %s: %s", asin, value)
+        if value is MISSING:
+            continue
+        for row in asin_rows:
+            row[HEADER] = value
+        patched += 1
+    logging.info("Buy Box Used fallback filled %s of %s ASINs", patched, len(todo))
+    return patched
@@ -0,0 +1,68 @@
+# column_formats.py
+# Display formatting for the CSV sink. Extractors return raw values (Keepa units, MISSING for
+# empty cells); format_rows renders a batch of rows column by column, so number formatting runs
+# once per written cell and only where a display string is wanted. Strings pass through
+# unchanged (text columns, and rows reused from a run_state.json written by an older version).
+from keepa_time import format_keepa_minutes
+from stable_deals import MISSING
+from stable_products import STAT_SPECS, STAT_FORMATS
+from history import WINDOW_SPECS
+from stats_batch import LEGACY_SPECS, TIMESTAMP_SPECS
+
+DISPLAY_FORMATS = dict(STAT_FORMATS, **{
+    'int': lambda value, divisor: str(value),
+    'percent_round': lambda value, divisor: f"{value:.0f}%",
+    'kg': lambda value, divisor: f"{value / divisor:.2f} kg",
+    'cm': lambda value, divisor: f"{value / divisor:.1f} cm",
+    'excel_text': lambda value, divisor: f'="{value}"',  # keeps Excel from reading ASINs as numbers
+})
+
+# header -> (kind, divisor); kinds are DISPLAY_FORMATS keys or 'timestamp' / 'date' (Keepa minutes)
+COLUMN_FORMATS = {}
+for _header, _key, _index, _divisor, _kind in STAT_SPECS:
+    COLUMN_FORMATS[_header] = (_kind, _divisor)
+for _header, _index, _days, _aggregate, _divisor, _kind in WINDOW_SPECS:
+    COLUMN_FORMATS[_header] = (_kind, _divisor)
+for _func, _header, _key, _index, _divisor, _kind, _rule in LEGACY_SPECS:
+    COLUMN_FORMATS[_header] = (_kind, _divisor)
+for _func, _header, _source, _getter, _date_only, _min_valid in TIMESTAMP_SPECS:
+    COLUMN_FORMATS[_header] = ('date' if _date_only else 'timestamp', 1)
+COLUMN_FORMATS.update({
+    'Percent Down 90': ('percent_round', 1),
+    'ASIN': ('excel_text', 1),
+    'Package Weight': ('kg', 1000),
+    'Package Height': ('cm', 10),
+    'Package Length': ('cm', 10),
+    'Package Width': ('cm', 10),
+    'Sales Rank - Drops last 30 days': ('int', 1),
+    'Sales Rank - Drops last 365 days': ('int', 1),
+    'New, 3rd Party FBA - Current': ('price', 100),
+    'New, 3rd Party FBM - Current': ('price', 100),
+    'Buy Box Used - Current': ('price', 100),
+})
+
+def format_column(kind, divisor, values):
+    if kind in ('timestamp', 'date'):
+        positions = [i for i, value in enumerate(values) if value is not MISSING and not isinstance(value, str)]
+        formatted = ['-' if value is MISSING else value for value in values]
+        if positions:
+            stamps = format_keepa_minutes([values[i] for i in positions], date_only=kind == 'date', min_valid=-1)
+            for i, text in zip(positions, stamps):
+                formatted[i] = text
+        return formatted
+    fmt = DISPLAY_FORMATS[kind]
+    if kind == 'excel_text':
+        return ['-' if value is MISSING else value if value.startswith('="') else fmt(value, divisor) for value in values]
+    return ['-' if value is MISSING else value if isinstance(value, str) else fmt(value, divisor) for value in values]
+
+def format_rows(rows, headers):
+    # rows: list of raw row dicts -> list of value lists in header order, ready for csv.writer
+    columns = []
+    for header in headers:
+        values = [row.get(header, '-') for row in rows]
+        spec = COLUMN_FORMATS.get(header)
+        if spec is None:
+            columns.append(['-' if value is MISSING else value for value in values])
+        else:
+            columns.append(format_column(spec[0], spec[1], values))
+    return [list(values) for values in zip(*columns)]
@@ -0,0 +1,205 @@
+# deal_store.py
+# Persistent history of every run (config "deal_store"): one SQLite row per ASIN per run with the
+# deal, the computed row (raw values) and indexed columns for lastUpdate, root category and sales
+# rank. Rows are buffered and upserted in one transaction per batch. Query from Python with
+# DealStore.query() or from the shell:
+#   python deal_store.py --category Books --max-rank 500000 --days 7
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+# Load store settings
+try:
+    with open('config.json') as f:
+        config = json.load(f)
+except Exception as e:
+    logging.error("Deal store config load failed: %s", e)
+    config = {}
+
+STORE_ENABLED = bool(config.get('deal_store', False))
+STORE_PATH = config.get('deal_store_path', 'deal_store.sqlite')
+STORE_BATCH_ROWS = 1000  # Rows buffered before one INSERT transaction
+
+def _pack(value):
+    # default=dict: rows may be compact records (memory-lean mode)
+    return zlib.compress(json.dumps(value, separators=(',', ':'), default=dict).encode('utf-8'))
+
+def _unpack(body):
+    return json.loads(zlib.decompress(body))
+
+def sales_rank(deal, row):
+    # Raw rank from the row; rows reused from an older run_state.json hold strings, so fall back to the deal
+    rank = row.get('Sales Rank - Current')
+    if isinstance(rank, int) and rank > 0:
+        return rank
+    current = deal.get('current') or []
+    return current[3] if len(current) > 3 and current[3] > 0 else None
+
+def root_category(row):
+    category = row.get('Categories - Root')
+    return category if isinstance(category, str) and category != '-' else None
+
+class DealStore:
+    def __init__(self, path=STORE_PATH, run_ts=None):
+        self.path = path
+        self.run_ts = run_ts if run_ts is not None else time.time()  # Run key, Unix seconds
+        self.stored = 0
+        self.finished = False
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS deals (
+            asin TEXT NOT NULL,
+            run_ts REAL NOT NULL,
+            last_update INTEGER,
+            root_cat INTEGER,
+            category TEXT,
+            sales_rank INTEGER,
+            deal BLOB NOT NULL,
+            row BLOB NOT NULL,
+            PRIMARY KEY (asin, run_ts))''')
+        # The primary key doubles as the ASIN index (asin is its first column)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_deals_run_ts ON deals (run_ts)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_deals_last_update ON deals (last_update)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_deals_category_rank ON deals (category, sales_rank)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_deals_sales_rank ON deals (sales_rank)')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS runs (
+            run_ts REAL PRIMARY KEY,
+            finished_ts REAL,
+            deals INTEGER,
+            rows INTEGER)''')
+        self._conn.commit()
+
+    def add(self, deal, row):
+        # Called from row-building threads; the batch goes to SQLite once STORE_BATCH_ROWS are buffered
+        record = (deal['asin'], self.run_ts, deal.get('lastUpdate'), deal.get('rootCat'), root_category(row), sales_rank(deal, row), _pack(deal), _pack(row))
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) >= STORE_BATCH_ROWS:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany('''INSERT INTO deals VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (asin, run_ts) DO UPDATE SET last_update = excluded.last_update, root_cat = excluded.root_cat,
+                    category = excluded.category, sales_rank = excluded.sales_rank, deal = excluded.deal, row = excluded.row''', self._buffer)
+            self.stored += len(self._buffer)
+        except sqlite3.Error as e:
+            logging.error("Deal store insert of %s rows failed: %s", len(self._buffer), e)
+        self._buffer = []
+
+    def finish(self, deal_count, row_count):
+        with self._lock:
+            self._flush()
+            with self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)', (self.run_ts, time.time(), deal_count, row_count))
+            self.finished = True
+        logging.info("Deal store: %s rows saved for run %s in %s", self.stored, self.run_ts, self.path)
+
+    # Query API starts
+    def query(self, category=None, max_rank=None, min_rank=None, days=None, asin=None, updated_since=None, latest=True, limit=None):
+        # category: root category name ('Books') or Keepa rootCat id; days: seen in the last N days;
+        # updated_since: deal lastUpdate in Keepa minutes; latest: one result per ASIN, its newest run.
+        # Returns dicts with the indexed columns plus the decoded deal and row, newest first.
+        where = []
+        args = []
+        if category is not None:
+            where.append('root_cat = ?' if isinstance(category, int) else 'category = ?')
+            args.append(category)
+        if max_rank is not None:
+            where.append('sales_rank <= ?')
+            args.append(max_rank)
+        if min_rank is not None:
+            where.append('sales_rank >= ?')
+            args.append(min_rank)
+        if days is not None:
+            where.append('run_ts >= ?')
+            args.append(time.time() - days * 86400)
+        if asin is not None:
+            where.append('asin = ?')
+            args.append(asin)
+        if updated_since is not None:
+            where.append('last_update >= ?')
+            args.append(updated_since)
+        columns = 'asin, run_ts, last_update, root_cat, category, sales_rank, deal, row'
+        sql = f"SELECT {columns} FROM deals"
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        if latest:
+            # Newest matching run per ASIN
+            sql = f"SELECT {columns} FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY asin ORDER BY run_ts DESC) AS newest FROM ({sql})) WHERE newest = 1"
+        sql += ' ORDER BY run_ts DESC, sales_rank'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [{'asin': r[0], 'run_ts': r[1], 'last_update': r[2], 'root_cat': r[3], 'category': r[4], 'sales_rank': r[5],
+                 'deal': _unpack(r[6]), 'row': _unpack(r[7])} for r in rows]
+
+    def history(self, asin):
+        # Every stored run of one ASIN, oldest first
+        return self.query(asin=asin, latest=False)[::-1]
+
+    def runs(self):
+        with self._lock:
+            return self._conn.execute('SELECT run_ts, finished_ts, deals, rows FROM runs ORDER BY run_ts DESC').fetchall()
+    # Query API ends
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+    def abort(self):
+        # Run failed before finish(): its rows are dropped so queries never return a partial run
+        with self._lock:
+            if self.finished:
+                return
+            self._buffer = []
+            try:
+                with self._conn:
+                    dropped = self._conn.execute('DELETE FROM deals WHERE run_ts = ?', (self.run_ts,)).rowcount
+                logging.warning("Deal store: run %s incomplete, %s stored rows dropped", self.run_ts, dropped)
+            except sqlite3.Error as e:
+                logging.error("Deal store cleanup for run %s failed: %s", self.run_ts, e)
+            self._conn.close()
+
+def open_store():
+    try:
+        return DealStore() if STORE_ENABLED else None
+    except sqlite3.Error as e:
+        logging.error("Deal store disabled, could not open %s: %s", STORE_PATH, e)
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the deal store')
+    parser.add_argument('--path', default=STORE_PATH)
+    parser.add_argument('--category', help='root category name, or Keepa rootCat id')
+    parser.add_argument('--max-rank', type=int)
+    parser.add_argument('--min-rank', type=int)
+    parser.add_argument('--days', type=float, help='seen in the last N days')
+    parser.add_argument('--asin', help='every stored run of this ASIN')
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+    store = DealStore(args.path)
+    category = int(args.category) if args.category and args.category.isdigit() else args.category
+    results = store.query(category, args.max_rank, args.min_rank, args.days, args.asin, latest=args.asin is None, limit=args.limit)
+    for r in results:
+        seen = time.strftime('%Y-%m-%d %H:%M', time.localtime(r['run_ts']))
+        rank = f"{r['sales_rank']:,}" if r['sales_rank'] is not None else '-'
+        print(f"{r['asin']}  {seen}  {rank:>11}  {r['category'] or '-'}  {str(r['row'].get('Title') or '-')[:60]}")
+    print(f"{len(results)} deals")
+    store.close()
+
+if __name__ == "__main__":
+    main()
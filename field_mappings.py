@@ -2,6 +2,8 @@
 # Chunk 1 starts
 from stable_products import (
     get_stat_value,                 # Utility function, not a header
+    STAT_SPECS,                     # Table of stats-driven columns, not a header
+    stat_columns,                   # All STAT_SPECS headers (see Chunk 2)
     percent_down_90,                # Percent Down 90
     # Avg. Price 90,
     # Percent Down 365,
@@ -219,7 +221,12 @@ from stable_products import (
     # Used Offer Count - 180 days avg.,
     # Used Offer Count - 365 days avg.
 )
+from history import (
+    WINDOW_SPECS,                   # Table of history-window columns, not a header
+    window_columns,                 # All WINDOW_SPECS headers (60-day averages, rank drops)
+)
 from stable_deals import (
+    MISSING,                        # Raw value of an empty cell, not a header
     # Percent Down 90,
     # Avg. Price 90,
     # Percent Down 365,
@@ -454,8 +461,8 @@ FUNCTION_LIST = [
     last_update,                    # last update
     last_price_change,              # last price change
     None,                           # Sales Rank - Reference
-    None,                           # Reviews - Rating
-    None,                           # Reviews - Review Count
+    stat_columns,                   # Reviews - Rating
+    stat_columns,                   # Reviews - Review Count
     None,                           # FBA Pick&Pack Fee
     None,                           # Referral Fee %
     tracking_since,                 # Tracking since
@@ -488,176 +495,227 @@ FUNCTION_LIST = [
     None,                           # Format
     sales_rank_current,             # Sales Rank - Current
     sales_rank_30_days_avg,         # Sales Rank - 30 days avg.
-    None,                           # Sales Rank - 60 days avg.
+    window_columns,                 # Sales Rank - 60 days avg.
     sales_rank_90_days_avg,         # Sales Rank - 90 days avg.
     sales_rank_180_days_avg,        # Sales Rank - 180 days avg.
     sales_rank_365_days_avg,        # Sales Rank - 365 days avg.
-    None,                           # Sales Rank - Lowest
-    None,                           # Sales Rank - Lowest 365 days
-    None,                           # Sales Rank - Highest
-    None,                           # Sales Rank - Highest 365 days
+    stat_columns,                   # Sales Rank - Lowest
+    stat_columns,                   # Sales Rank - Lowest 365 days
+    stat_columns,                   # Sales Rank - Highest
+    stat_columns,                   # Sales Rank - Highest 365 days
     sales_rank_drops_last_30_days,  # Sales Rank - Drops last 30 days
-    None,                           # Sales Rank - Drops last 60 days
-    None,                           # Sales Rank - Drops last 90 days
-    None,                           # Sales Rank - Drops last 180 days
+    window_columns,                 # Sales Rank - Drops last 60 days
+    window_columns,                 # Sales Rank - Drops last 90 days
+    window_columns,                 # Sales Rank - Drops last 180 days
     sales_rank_drops_last_365_days, # Sales Rank - Drops last 365 days
     buy_box_current,                # Buy Box - Current
-    None,                           # Buy Box - 30 days avg.
-    None,                           # Buy Box - 60 days avg.
-    None,                           # Buy Box - 90 days avg.
-    None,                           # Buy Box - 180 days avg.
-    None,                           # Buy Box - 365 days avg.
-    None,                           # Buy Box - Lowest
-    None,                           # Buy Box - Lowest 365 days
-    None,                           # Buy Box - Highest
-    None,                           # Buy Box - Highest 365 days
-    None,                           # Buy Box - 90 days OOS
+    stat_columns,                   # Buy Box - 30 days avg.
+    window_columns,                 # Buy Box - 60 days avg.
+    stat_columns,                   # Buy Box - 90 days avg.
+    stat_columns,                   # Buy Box - 180 days avg.
+    stat_columns,                   # Buy Box - 365 days avg.
+    stat_columns,                   # Buy Box - Lowest
+    stat_columns,                   # Buy Box - Lowest 365 days
+    stat_columns,                   # Buy Box - Highest
+    stat_columns,                   # Buy Box - Highest 365 days
+    stat_columns,                   # Buy Box - 90 days OOS
     None,                           # Buy Box - Stock
     None,                           # Amazon - Current
-    None,                           # Amazon - 30 days avg.
-    None,                           # Amazon - 60 days avg.
-    None,                           # Amazon - 90 days avg.
-    None,                           # Amazon - 180 days avg.
-    None,                           # Amazon - 365 days avg.
-    None,                           # Amazon - Lowest
-    None,                           # Amazon - Lowest 365 days
-    None,                           # Amazon - Highest
-    None,                           # Amazon - Highest 365 days
-    None,                           # Amazon - 90 days OOS
+    stat_columns,                   # Amazon - 30 days avg.
+    window_columns,                 # Amazon - 60 days avg.
+    stat_columns,                   # Amazon - 90 days avg.
+    stat_columns,                   # Amazon - 180 days avg.
+    stat_columns,                   # Amazon - 365 days avg.
+    stat_columns,                   # Amazon - Lowest
+    stat_columns,                   # Amazon - Lowest 365 days
+    stat_columns,                   # Amazon - Highest
+    stat_columns,                   # Amazon - Highest 365 days
+    stat_columns,                   # Amazon - 90 days OOS
     None,                           # Amazon - Stock
     new_current,                    # New - Current
-    None,                           # New - 30 days avg.
-    None,                           # New - 60 days avg.
-    None,                           # New - 90 days avg.
-    None,                           # New - 180 days avg.
-    None,                           # New - 365 days avg.
-    None,                           # New - Lowest
-    None,                           # New - Lowest 365 days
-    None,                           # New - Highest
-    None,                           # New - Highest 365 days
-    None,                           # New - 90 days OOS
+    stat_columns,                   # New - 30 days avg.
+    window_columns,                 # New - 60 days avg.
+    stat_columns,                   # New - 90 days avg.
+    stat_columns,                   # New - 180 days avg.
+    stat_columns,                   # New - 365 days avg.
+    stat_columns,                   # New - Lowest
+    stat_columns,                   # New - Lowest 365 days
+    stat_columns,                   # New - Highest
+    stat_columns,                   # New - Highest 365 days
+    stat_columns,                   # New - 90 days OOS
     None,                           # New - Stock
     new_3rd_party_fba_current,      # New, 3rd Party FBA - Current
-    None,                           # New, 3rd Party FBA - 30 days avg.
-    None,                           # New, 3rd Party FBA - 60 days avg.
-    None,                           # New, 3rd Party FBA - 90 days avg.
-    None,                           # New, 3rd Party FBA - 180 days avg.
-    None,                           # New, 3rd Party FBA - 365 days avg.
-    None,                           # New, 3rd Party FBA - Lowest
-    None,                           # New, 3rd Party FBA - Lowest 365 days
-    None,                           # New, 3rd Party FBA - Highest
-    None,                           # New, 3rd Party FBA - Highest 365 days
-    None,                           # New, 3rd Party FBA - 90 days OOS
+    stat_columns,                   # New, 3rd Party FBA - 30 days avg.
+    window_columns,                 # New, 3rd Party FBA - 60 days avg.
+    stat_columns,                   # New, 3rd Party FBA - 90 days avg.
+    stat_columns,                   # New, 3rd Party FBA - 180 days avg.
+    stat_columns,                   # New, 3rd Party FBA - 365 days avg.
+    stat_columns,                   # New, 3rd Party FBA - Lowest
+    stat_columns,                   # New, 3rd Party FBA - Lowest 365 days
+    stat_columns,                   # New, 3rd Party FBA - Highest
+    stat_columns,                   # New, 3rd Party FBA - Highest 365 days
+    stat_columns,                   # New, 3rd Party FBA - 90 days OOS
     None,                           # New, 3rd Party FBA - Stock
     new_3rd_party_fbm_current,      # New, 3rd Party FBM - Current
-    None,                           # New, 3rd Party FBM - 30 days avg.
-    None,                           # New, 3rd Party FBM - 60 days avg.
-    None,                           # New, 3rd Party FBM - 90 days avg.
-    None,                           # New, 3rd Party FBM - 180 days avg.
-    None,                           # New, 3rd Party FBM - 365 days avg.
-    None,                           # New, 3rd Party FBM - Lowest
-    None,                           # New, 3rd Party FBM - Lowest 365 days
-    None,                           # New, 3rd Party FBM - Highest
-    None,                           # New, 3rd Party FBM - Highest 365 days
-    None,                           # New, 3rd Party FBM - 90 days OOS
+    stat_columns,                   # New, 3rd Party FBM - 30 days avg.
+    window_columns,                 # New, 3rd Party FBM - 60 days avg.
+    stat_columns,                   # New, 3rd Party FBM - 90 days avg.
+    stat_columns,                   # New, 3rd Party FBM - 180 days avg.
+    stat_columns,                   # New, 3rd Party FBM - 365 days avg.
+    stat_columns,                   # New, 3rd Party FBM - Lowest
+    stat_columns,                   # New, 3rd Party FBM - Lowest 365 days
+    stat_columns,                   # New, 3rd Party FBM - Highest
+    stat_columns,                   # New, 3rd Party FBM - Highest 365 days
+    stat_columns,                   # New, 3rd Party FBM - 90 days OOS
     None,                           # New, 3rd Party FBM - Stock
     buy_box_used_current,           # Buy Box Used - Current
-    None,                           # Buy Box Used - 30 days avg.
-    None,                           # Buy Box Used - 60 days avg.
-    None,                           # Buy Box Used - 90 days avg.
-    None,                           # Buy Box Used - 180 days avg.
-    None,                           # Buy Box Used - 365 days avg.
-    None,                           # Buy Box Used - Lowest
-    None,                           # Buy Box Used - Lowest 365 days
-    None,                           # Buy Box Used - Highest
-    None,                           # Buy Box Used - Highest 365 days
-    None,                           # Buy Box Used - 90 days OOS
+    stat_columns,                   # Buy Box Used - 30 days avg.
+    window_columns,                 # Buy Box Used - 60 days avg.
+    stat_columns,                   # Buy Box Used - 90 days avg.
+    stat_columns,                   # Buy Box Used - 180 days avg.
+    stat_columns,                   # Buy Box Used - 365 days avg.
+    stat_columns,                   # Buy Box Used - Lowest
+    stat_columns,                   # Buy Box Used - Lowest 365 days
+    stat_columns,                   # Buy Box Used - Highest
+    stat_columns,                   # Buy Box Used - Highest 365 days
+    stat_columns,                   # Buy Box Used - 90 days OOS
     None,                           # Buy Box Used - Stock
     used_current,                   # Used - Current
-    None,                           # Used - 30 days avg.
-    None,                           # Used - 60 days avg.
-    None,                           # Used - 90 days avg.
-    None,                           # Used - 180 days avg.
-    None,                           # Used - 365 days avg.
-    None,                           # Used - Lowest
-    None,                           # Used - Lowest 365 days
-    None,                           # Used - Highest
-    None,                           # Used - Highest 365 days
-    None,                           # Used - 90 days OOS
+    stat_columns,                   # Used - 30 days avg.
+    window_columns,                 # Used - 60 days avg.
+    stat_columns,                   # Used - 90 days avg.
+    stat_columns,                   # Used - 180 days avg.
+    stat_columns,                   # Used - 365 days avg.
+    stat_columns,                   # Used - Lowest
+    stat_columns,                   # Used - Lowest 365 days
+    stat_columns,                   # Used - Highest
+    stat_columns,                   # Used - Highest 365 days
+    stat_columns,                   # Used - 90 days OOS
     None,                           # Used - Stock
     used_like_new,                  # Used, like new - Current
-    None,                           # Used, like new - 30 days avg.
-    None,                           # Used, like new - 60 days avg.
-    None,                           # Used, like new - 90 days avg.
-    None,                           # Used, like new - 180 days avg.
-    None,                           # Used, like new - 365 days avg.
-    None,                           # Used, like new - Lowest
-    None,                           # Used, like new - Lowest 365 days
-    None,                           # Used, like new - Highest
-    None,                           # Used, like new - Highest 365 days
-    None,                           # Used, like new - 90 days OOS
+    stat_columns,                   # Used, like new - 30 days avg.
+    window_columns,                 # Used, like new - 60 days avg.
+    stat_columns,                   # Used, like new - 90 days avg.
+    stat_columns,                   # Used, like new - 180 days avg.
+    stat_columns,                   # Used, like new - 365 days avg.
+    stat_columns,                   # Used, like new - Lowest
+    stat_columns,                   # Used, like new - Lowest 365 days
+    stat_columns,                   # Used, like new - Highest
+    stat_columns,                   # Used, like new - Highest 365 days
+    stat_columns,                   # Used, like new - 90 days OOS
     None,                           # Used, like new - Stock
     used_very_good,                 # Used, very good - Current
-    None,                           # Used, very good - 30 days avg.
-    None,                           # Used, very good - 60 days avg.
-    None,                           # Used, very good - 90 days avg.
-    None,                           # Used, very good - 180 days avg.
-    None,                           # Used, very good - 365 days avg.
-    None,                           # Used, very good - Lowest
-    None,                           # Used, very good - Lowest 365 days
-    None,                           # Used, very good - Highest
-    None,                           # Used, very good - Highest 365 days
-    None,                           # Used, very good - 90 days OOS
+    stat_columns,                   # Used, very good - 30 days avg.
+    window_columns,                 # Used, very good - 60 days avg.
+    stat_columns,                   # Used, very good - 90 days avg.
+    stat_columns,                   # Used, very good - 180 days avg.
+    stat_columns,                   # Used, very good - 365 days avg.
+    stat_columns,                   # Used, very good - Lowest
+    stat_columns,                   # Used, very good - Lowest 365 days
+    stat_columns,                   # Used, very good - Highest
+    stat_columns,                   # Used, very good - Highest 365 days
+    stat_columns,                   # Used, very good - 90 days OOS
     None,                           # Used, very good - Stock
     used_good,                      # Used, good - Current
-    None,                           # Used, good - 30 days avg.
-    None,                           # Used, good - 60 days avg.
-    None,                           # Used, good - 90 days avg.
-    None,                           # Used, good - 180 days avg.
-    None,                           # Used, good - 365 days avg.
-    None,                           # Used, good - Lowest
-    None,                           # Used, good - Lowest 365 days
-    None,                           # Used, good - Highest
-    None,                           # Used, good - Highest 365 days
-    None,                           # Used, good - 90 days OOS
+    stat_columns,                   # Used, good - 30 days avg.
+    window_columns,                 # Used, good - 60 days avg.
+    stat_columns,                   # Used, good - 90 days avg.
+    stat_columns,                   # Used, good - 180 days avg.
+    stat_columns,                   # Used, good - 365 days avg.
+    stat_columns,                   # Used, good - Lowest
+    stat_columns,                   # Used, good - Lowest 365 days
+    stat_columns,                   # Used, good - Highest
+    stat_columns,                   # Used, good - Highest 365 days
+    stat_columns,                   # Used, good - 90 days OOS
     None,                           # Used, good - Stock
     used_acceptable,                # Used, acceptable - Current
-    None,                           # Used, acceptable - 30 days avg.
-    None,                           # Used, acceptable - 60 days avg.
-    None,                           # Used, acceptable - 90 days avg.
-    None,                           # Used, acceptable - 180 days avg.
-    None,                           # Used, acceptable - 365 days avg.
-    None,                           # Used, acceptable - Lowest
-    None,                           # Used, acceptable - Lowest 365 days
-    None,                           # Used, acceptable - Highest
-    None,                           # Used, acceptable - Highest 365 days
-    None,                           # Used, acceptable - 90 days OOS
+    stat_columns,                   # Used, acceptable - 30 days avg.
+    window_columns,                 # Used, acceptable - 60 days avg.
+    stat_columns,                   # Used, acceptable - 90 days avg.
+    stat_columns,                   # Used, acceptable - 180 days avg.
+    stat_columns,                   # Used, acceptable - 365 days avg.
+    stat_columns,                   # Used, acceptable - Lowest
+    stat_columns,                   # Used, acceptable - Lowest 365 days
+    stat_columns,                   # Used, acceptable - Highest
+    stat_columns,                   # Used, acceptable - Highest 365 days
+    stat_columns,                   # Used, acceptable - 90 days OOS
     None,                           # Used, acceptable - Stock
     list_price,	                        # List Price - Current
-    None,                           # List Price - 30 days avg.
-    None,                           # List Price - 60 days avg.
-    None,                           # List Price - 90 days avg.
-    None,                           # List Price - 180 days avg.
-    None,                           # List Price - 365 days avg.
-    None,                           # List Price - Lowest
-    None,                           # List Price - Lowest 365 days
-    None,                           # List Price - Highest
-    None,                           # List Price - Highest 365 days
-    None,                           # List Price - 90 days OOS
+    stat_columns,                   # List Price - 30 days avg.
+    window_columns,                 # List Price - 60 days avg.
+    stat_columns,                   # List Price - 90 days avg.
+    stat_columns,                   # List Price - 180 days avg.
+    stat_columns,                   # List Price - 365 days avg.
+    stat_columns,                   # List Price - Lowest
+    stat_columns,                   # List Price - Lowest 365 days
+    stat_columns,                   # List Price - Highest
+    stat_columns,                   # List Price - Highest 365 days
+    stat_columns,                   # List Price - 90 days OOS
     None,                           # List Price - Stock
-    None,                           # New Offer Count - Current
-    None,                           # New Offer Count - 30 days avg.
-    None,                           # New Offer Count - 60 days avg.
-    None,                           # New Offer Count - 90 days avg.
-    None,                           # New Offer Count - 180 days avg.
-    None,                           # New Offer Count - 365 days avg.
-    None,                           # Used Offer Count - Current
-    None,                           # Used Offer Count - 30 days avg.
-    None,                           # Used Offer Count - 60 days avg.
-    None,                           # Used Offer Count - 90 days avg.
-    None,                           # Used Offer Count - 180 days avg.
-    None                            # Used Offer Count - 365 days avg.
+    stat_columns,                   # New Offer Count - Current
+    stat_columns,                   # New Offer Count - 30 days avg.
+    window_columns,                 # New Offer Count - 60 days avg.
+    stat_columns,                   # New Offer Count - 90 days avg.
+    stat_columns,                   # New Offer Count - 180 days avg.
+    stat_columns,                   # New Offer Count - 365 days avg.
+    stat_columns,                   # Used Offer Count - Current
+    stat_columns,                   # Used Offer Count - 30 days avg.
+    window_columns,                 # Used Offer Count - 60 days avg.
+    stat_columns,                   # Used Offer Count - 90 days avg.
+    stat_columns,                   # Used Offer Count - 180 days avg.
+    stat_columns                    # Used Offer Count - 365 days avg.
 ]
 # Chunk 2 ends
 
+# Chunk 3 starts
+# Extraction plan: compiled once at startup from headers.json + FUNCTION_LIST. None slots are dropped
+# and each function's input (deal or product) is resolved up front, so the per-product loop only
+# runs live extractors. stable_deals functions take the deal; everything else takes the product.
+import logging
+import time
+from log_setup import set_trace_asin
+from metrics import metrics
+
+DEAL_HEADERS = ('Deal found', 'last update', 'last price change')
+
+def compile_plan(headers, exclude=()):
+    if len(headers) != len(FUNCTION_LIST):
+        raise ValueError(f"headers.json has {len(headers)} headers but FUNCTION_LIST has {len(FUNCTION_LIST)} entries")
+    duplicates = sorted({h for h in headers if headers.count(h) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate headers in headers.json: {duplicates}")
+    # A function listed under several headers (e.g. stat_columns) fills all of them in one call
+    func_headers = {}
+    for header, func in zip(headers, FUNCTION_LIST):
+        if func is None:
+            continue
+        uses_deal = func.__module__ == 'stable_deals'
+        if uses_deal != (header in DEAL_HEADERS):
+            raise ValueError(f"FUNCTION_LIST is out of line with headers.json at '{header}' ({func.__name__})")
+        func_headers.setdefault(func, []).append(header)
+    for func, specs in ((stat_columns, STAT_SPECS), (window_columns, WINDOW_SPECS)):
+        if sorted(func_headers.get(func, [])) != sorted(spec[0] for spec in specs):
+            raise ValueError(f"{func.__name__} slots in FUNCTION_LIST do not match its spec table")
+    # exclude: extractors computed elsewhere (e.g. stats_batch in batch mode)
+    plan = tuple((tuple(hs), func, func.__module__ == 'stable_deals') for func, hs in func_headers.items() if func not in exclude)
+    logging.info("Extraction plan: %s live extractors covering %s of %s headers", len(plan), sum(len(hs) for hs, _, _ in plan), len(headers))
+    return plan
+
+def extract_row(plan, deal, product):
+    set_trace_asin(deal.get('asin'))
+    row = {}
+    timings = []
+    for headers, func, uses_deal in plan:
+        start = time.perf_counter()
+        try:
+            row.update(func(deal if uses_deal else product))
+        except Exception as e:
+            logging.error("Function %s failed for ASIN %s: %s", func.__name__, deal.get('asin', '-'), e)
+            for header in headers:
+                row[header] = MISSING
+        timings.append((func.__name__, time.perf_counter() - start))
+    metrics.record_fields(timings)
+    return row
+# Chunk 3 ends
+
 #### END OF FILE ####
\ No newline at end of file
@@ -0,0 +1,199 @@
+# history.py
+# Decodes Keepa `csv` history arrays (requested with history=1) into NumPy time series.
+# Each product['csv'][type] is a flat [keepaMinute, value, keepaMinute, value, ...] list, or
+# [keepaMinute, price, shipping, ...] for the *_SHIPPING types. Decoded series are cached on the
+# product under '_history' so every column reads the same arrays. The window columns decode only
+# the tail they need and are all answered from one SeriesIndex per product.
+import bisect
+import numpy as np
+from stable_deals import MISSING
+from stable_products import PRICE_SERIES
+
+KEEPA_EPOCH = np.datetime64('2011-01-01T00:00', 'm')
+# csv types stored as (time, price, shipping) triples; the decoded value is price + shipping
+SHIPPING_SERIES = frozenset({7, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 32})
+EMPTY_SERIES = (np.array([], dtype='datetime64[m]'), np.array([], dtype=np.int32))
+
+def decode_series(raw, with_shipping=False):
+    if not raw:
+        return EMPTY_SERIES
+    step = 3 if with_shipping else 2
+    flat = np.asarray(raw, dtype=np.int64)
+    pairs = flat[:len(flat) - len(flat) % step].reshape(-1, step)
+    values = pairs[:, 1]
+    if with_shipping:
+        # -1 (no offer) stays -1; unknown shipping (-1) counts as free
+        values = np.where(values < 0, values, values + np.maximum(pairs[:, 2], 0))
+    times = KEEPA_EPOCH + pairs[:, 0].astype('timedelta64[m]')
+    return times, values.astype(np.int32)
+
+def product_history(product, index):
+    cache = product.get('_history')
+    if cache is None:
+        cache = product['_history'] = {}
+    series = cache.get(index)
+    if series is None:
+        csv_data = product.get('csv') or []
+        raw = csv_data[index] if index < len(csv_data) else None
+        series = cache[index] = decode_series(raw, index in SHIPPING_SERIES)
+    return series
+
+def decode_history(product):
+    # Decodes every series present on the product; returns {csv type: (times, values)}
+    for index, raw in enumerate(product.get('csv') or []):
+        if raw:
+            product_history(product, index)
+    return product.get('_history', {})
+
+# Window aggregates starts
+# Any-window aggregates over decoded series, for columns Keepa's stats object lacks (60-day
+# averages, 60/90/180-day rank drops). A series is a step function: each value holds until the
+# next timestamp, the last one until `now`; -1 (no offer / no data) is excluded.
+# 2026-10-18: One SeriesIndex covers all of a product's window series: they are concatenated and
+# keyed by (series, minute), prefix sums are built once for all of them, and every window of every
+# series is answered by one searchsorted, instead of ~25 small NumPy calls per series and column.
+SERIES_KEY = np.int64(1) << 40  # Keepa minutes stay far below this, so series ids sort first
+BIG = np.iinfo(np.int64).max  # Empty-window marker for minimums
+
+class SeriesIndex:
+    def __init__(self, series, now):
+        # series: [(times as Keepa minutes, values)]; queries refer to series by position
+        self.now = now
+        lengths = np.array([len(times) for times, _ in series], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)))
+        minutes = np.concatenate([np.asarray(times, dtype=np.int64) for times, _ in series]) if series else np.array([], dtype=np.int64)
+        self.values = np.concatenate([np.asarray(values, dtype=np.int64) for _, values in series]) if series else np.array([], dtype=np.int64)
+        self.ids = np.repeat(np.arange(len(series), dtype=np.int64), lengths)
+        self.keys = self.ids * SERIES_KEY + minutes
+        self.starts = minutes
+        # Each value lasts until the next timestamp of the same series, the last one until now
+        self.ends = np.empty_like(minutes)
+        self.ends[:-1] = minutes[1:]
+        last = self.offsets[1:][lengths > 0] - 1
+        self.ends[last] = now
+        self.valid = self.values >= 0
+        durations = np.where(self.valid, np.maximum(self.ends - minutes, 0), 0)
+        self.sum_prefix = np.concatenate(([0], np.cumsum(self.values * durations)))
+        self.time_prefix = np.concatenate(([0], np.cumsum(durations)))
+        # A drop is a valid value lower than the previous valid value of the same series (rank improved)
+        drops = np.zeros(len(minutes), dtype=np.int64)
+        if len(minutes) > 1:
+            drops[1:] = self.valid[1:] & self.valid[:-1] & (self.values[1:] < self.values[:-1]) & (self.ids[1:] == self.ids[:-1])
+        self.drop_prefix = np.concatenate(([0], np.cumsum(drops)))
+
+    def _windows(self, ids, starts):
+        # First segment of each window (the one containing its start, or the first one after it),
+        # the end of its series, and whether the series has any points
+        ids = np.asarray(ids, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.int64)
+        first = self.offsets[ids]
+        stop = self.offsets[ids + 1]
+        k = np.maximum(np.searchsorted(self.keys, ids * SERIES_KEY + starts, side='right') - 1, first)
+        return starts, np.minimum(k, np.maximum(stop - 1, 0)), stop, stop > first
+
+    def averages(self, ids, starts):
+        starts, k, stop, present = self._windows(ids, starts)
+        if not len(self.starts):
+            return np.full(len(starts), -1, dtype=np.int64)
+        total = self.sum_prefix[stop] - self.sum_prefix[k + 1]
+        covered = self.time_prefix[stop] - self.time_prefix[k + 1]
+        partial = np.where(self.valid[k], np.maximum(self.ends[k] - np.maximum(starts, self.starts[k]), 0), 0)
+        total = total + self.values[k] * partial
+        covered = covered + partial
+        result = np.where(covered > 0, np.round(total / np.maximum(covered, 1)), -1).astype(np.int64)
+        return np.where(present, result, -1)
+
+    def _reduce(self, ufunc, fill, ids, starts):
+        starts, k, stop, present = self._windows(ids, starts)
+        if not len(self.starts):
+            return np.full(len(starts), -1, dtype=np.int64)
+        # reduceat over [k, stop) pairs; the appended fill keeps every index in range
+        values = np.append(np.where(self.valid, self.values, fill), fill)
+        bounds = np.empty(2 * len(k), dtype=np.int64)
+        bounds[0::2] = k
+        bounds[1::2] = stop
+        result = ufunc.reduceat(values, bounds)[0::2]
+        return np.where(present & (result != fill), result, -1)
+
+    def minimums(self, ids, starts):
+        return self._reduce(np.minimum, BIG, ids, starts)
+
+    def maximums(self, ids, starts):
+        return self._reduce(np.maximum, -1, ids, starts)
+
+    def drop_counts(self, ids, starts):
+        starts, _, stop, present = self._windows(ids, starts)
+        if not len(self.starts):
+            return np.full(len(starts), -1, dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        first = np.maximum(np.searchsorted(self.keys, ids * SERIES_KEY + starts, side='left'), self.offsets[ids] + 1)
+        return np.where(present, self.drop_prefix[stop] - self.drop_prefix[np.minimum(first, stop)], -1)
+
+AGGREGATES = {'average': SeriesIndex.averages, 'minimum': SeriesIndex.minimums, 'maximum': SeriesIndex.maximums, 'drops': SeriesIndex.drop_counts}
+
+# (header, csv index, days, aggregate, divisor, kind)
+WINDOW_SPECS = [
+    ('Sales Rank - 60 days avg.', 3, 60, 'average', 1, 'count'),
+    ('Sales Rank - Drops last 60 days', 3, 60, 'drops', 1, 'count'),
+    ('Sales Rank - Drops last 90 days', 3, 90, 'drops', 1, 'count'),
+    ('Sales Rank - Drops last 180 days', 3, 180, 'drops', 1, 'count'),
+    ('New Offer Count - 60 days avg.', 11, 60, 'average', 1, 'count'),
+    ('Used Offer Count - 60 days avg.', 12, 60, 'average', 1, 'count'),
+] + [(f"{name} - 60 days avg.", index, 60, 'average', 100, 'price') for name, index in PRICE_SERIES]
+
+def _window_groups(specs):
+    # csv indexes in first-use order with their widest window (minutes), plus per aggregate:
+    # (function, headers, series positions, window lengths in minutes), so a product needs one
+    # call per aggregate
+    indexes = {}
+    groups = {}
+    for header, index, days, aggregate, _, _ in specs:
+        indexes[index] = max(indexes.get(index, 0), days * 1440)
+        headers, positions, minutes = groups.setdefault(aggregate, ([], [], []))
+        headers.append(header)
+        positions.append(list(indexes).index(index))
+        minutes.append(days * 1440)
+    return list(indexes.items()), [(AGGREGATES[aggregate], headers, np.array(positions, dtype=np.int64), np.array(minutes, dtype=np.int64))
+                                   for aggregate, (headers, positions, minutes) in groups.items()]
+
+WINDOW_INDEXES, WINDOW_GROUPS = _window_groups(WINDOW_SPECS)
+
+class _Timestamps:
+    # The keepaMinute entries of a flat csv list, for bisect without copying the list
+    __slots__ = ('raw', 'step')
+
+    def __init__(self, raw, step):
+        self.raw = raw
+        self.step = step
+
+    def __len__(self):
+        return len(self.raw) // self.step
+
+    def __getitem__(self, i):
+        return self.raw[i * self.step]
+
+def window_series(raw, with_shipping, since):
+    # (Keepa minutes, values) of the part of a csv series the windows starting at `since` read:
+    # the segment containing `since` onwards, plus the point before it so a drop at its start counts
+    step = 3 if with_shipping else 2
+    if raw:
+        first = max(bisect.bisect_right(_Timestamps(raw, step), since) - 2, 0)
+        raw = raw[first * step:]
+    times, values = decode_series(raw, with_shipping)
+    return (times - KEEPA_EPOCH).astype(np.int64), values
+
+def keepa_now():
+    return int((np.datetime64('now', 'm') - KEEPA_EPOCH).astype(np.int64))
+
+def window_columns(product, now=None):
+    now = keepa_now() if now is None else now
+    csv_data = product.get('csv') or []
+    series = [window_series(csv_data[index] if index < len(csv_data) else None, index in SHIPPING_SERIES, now - widest)
+              for index, widest in WINDOW_INDEXES]
+    windows = SeriesIndex(series, now)
+    row = {}
+    for aggregate, headers, positions, minutes in WINDOW_GROUPS:
+        for header, value in zip(headers, aggregate(windows, positions, now - minutes).tolist()):
+            row[header] = MISSING if value < 0 else value
+    return row
+# Window aggregates ends
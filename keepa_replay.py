@@ -0,0 +1,190 @@
+# keepa_replay.py
+# Record/replay for offline runs. Record mode (config "keepa_record_dir") saves every Keepa
+# response that goes through keepa_session, keyed by endpoint + query parameters without the API
+# key. Replay mode is a local stub server speaking /deal and /product from those files, with
+# configurable latency, error rate and token bucket; point "keepa_api_url" at it and the fetchers
+# and the keepa client fallback run unmodified.
+#   python keepa_replay.py --dir keepa_recordings --port 8765 --latency-ms 150 --error-rate 0.02
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IGNORED_PARAMS = ('key',)
+
+def request_key(path, params):
+    # params: [(name, value)]; order-independent and without the API key. The keepa client
+    # requests /product/?..., the HTTP fetchers /product?..., so the trailing slash is dropped.
+    path = path.rstrip('/')
+    pairs = sorted((name, value) for name, value in params if name not in IGNORED_PARAMS)
+    return f"{path}?{urllib.parse.urlencode(pairs)}"
+
+def recording_name(key):
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20] + '.json'
+
+def record_response(response, directory):
+    # requests response hook: saves successful Keepa responses
+    try:
+        if response.status_code != 200:
+            return
+        parts = urllib.parse.urlsplit(response.url)
+        params = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        key = request_key(parts.path, params)
+        entry = {
+            'path': parts.path.rstrip('/'),
+            'params': [[name, value] for name, value in params if name not in IGNORED_PARAMS],
+            'status': response.status_code,
+            'body': response.json(),
+        }
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, recording_name(key))
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        logging.debug("Recorded %s to %s", key[:120], path)
+    except Exception as e:
+        logging.error("Recording failed for %s: %s", response.url.split('key=')[0], e)
+
+# Replay starts
+class RecordingStore:
+    def __init__(self, directory):
+        self.exact = {}
+        self.products = {}  # (asin, product params without asin) -> product, for re-batched requests
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                entry = json.load(f)
+            params = [tuple(pair) for pair in entry['params']]
+            self.exact[request_key(entry['path'], params)] = entry['body']
+            if entry['path'] == '/product':
+                others = request_key('/product', [p for p in params if p[0] != 'asin'])
+                for product in entry['body'].get('products') or []:
+                    self.products[(product.get('asin'), others)] = product
+        logging.info("Replay store: %s responses, %s products from %s", len(self.exact), len(self.products), directory)
+
+    def lookup(self, path, params):
+        body = self.exact.get(request_key(path, params))
+        if body is not None or path != '/product':
+            return body
+        asins = [asin for name, value in params if name == 'asin' for asin in value.split(',')]
+        others = request_key('/product', [p for p in params if p[0] != 'asin'])
+        products = [self.products.get((asin, others)) for asin in asins]
+        if not asins or None in products:
+            return None
+        return {'products': products, 'tokensConsumed': len(products)}
+
+class TokenBucket:
+    # Keepa-style budget: refill_rate tokens per minute up to max_tokens
+    def __init__(self, tokens, refill_rate, max_tokens=None):
+        self.tokens = tokens
+        self.refill_rate = refill_rate
+        self.max_tokens = max_tokens if max_tokens is not None else tokens
+        self.started = time.monotonic()
+        self.refills = 0
+        self._lock = threading.Lock()
+
+    def consume(self, cost):
+        # Returns (tokensLeft, refillIn ms) after charging `cost`
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            refills = int(elapsed // 60)
+            if refills > self.refills:
+                self.tokens = min(self.max_tokens, self.tokens + (refills - self.refills) * self.refill_rate)
+                self.refills = refills
+            self.tokens -= cost
+            return self.tokens, int((60 - elapsed % 60) * 1000)
+
+class StubHandler(BaseHTTPRequestHandler):
+    store = None
+    bucket = None
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    error_status = 429
+    rng = random.Random(0)
+
+    def do_GET(self):
+        parts = urllib.parse.urlsplit(self.path)
+        path = parts.path.rstrip('/')
+        params = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if self.rng.random() < self.error_rate:
+            tokens_left, refill_in = self.bucket.consume(0)
+            return self._send(self.error_status, {'error': {'type': 'simulated'}, 'tokensLeft': tokens_left, 'refillIn': refill_in, 'refillRate': self.bucket.refill_rate})
+        if path == '/token':
+            # keepa.Keepa checks its token status on construction
+            tokens_left, refill_in = self.bucket.consume(0)
+            return self._send(200, {'tokensLeft': tokens_left, 'refillIn': refill_in, 'refillRate': self.bucket.refill_rate, 'timestamp': int(time.time() * 1000), 'tokensConsumed': 0})
+        body = self.store.lookup(path, params)
+        if body is None:
+            logging.warning("Replay miss: %s", request_key(path, params)[:200])
+            return self._send(404, {'error': {'type': 'notRecorded', 'message': request_key(path, params)}})
+        body = dict(body)
+        tokens_left, refill_in = self.bucket.consume(body.get('tokensConsumed') or 1)
+        if tokens_left < 0:
+            return self._send(429, {'tokensLeft': tokens_left, 'refillIn': refill_in, 'refillRate': self.bucket.refill_rate})
+        body.update(tokensLeft=tokens_left, refillIn=refill_in, refillRate=self.bucket.refill_rate, timestamp=int(time.time() * 1000))
+        self._send(200, body)
+
+    def _send(self, status, body):
+        data = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        logging.debug("Stub: " + fmt, *args)
+
+def start_stub(directory, host='127.0.0.1', port=0, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=429, tokens=300, refill_rate=20, seed=0):
+    # Serves in a daemon thread; returns the server (server.server_address has the bound port)
+    handler = type('ReplayHandler', (StubHandler,), {
+        'store': RecordingStore(directory),
+        'bucket': TokenBucket(tokens, refill_rate),
+        'latency': latency_ms / 1000.0,
+        'jitter': jitter_ms / 1000.0,
+        'error_rate': error_rate,
+        'error_status': error_status,
+        'rng': random.Random(seed),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='keepa-stub', daemon=True).start()
+    logging.info("Keepa stub serving %s on http://%s:%s", directory, *server.server_address[:2])
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve recorded Keepa responses for offline runs')
+    parser.add_argument('--dir', default='keepa_recordings')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=429)
+    parser.add_argument('--tokens', type=int, default=300)
+    parser.add_argument('--refill-rate', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    server = start_stub(args.dir, args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.error_status, args.tokens, args.refill_rate, args.seed)
+    print(f"Keepa stub on http://{args.host}:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
+# Replay ends
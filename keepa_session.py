@@ -0,0 +1,91 @@
+# keepa_session.py
+# Shared HTTP transport for every Keepa call site: pooled keep-alive connections, gzip,
+# and the same User-Agent everywhere. One HTTPAdapter (urllib3 connection pool, thread-safe) is
+# mounted on every session, so all threads reuse the same open connections. The Session objects
+# stay per thread (including asyncio.to_thread workers) because requests.Session itself (cookies,
+# hooks, header merging) is not guaranteed thread-safe.
+# Also the record/replay switch point: "keepa_api_url" redirects every call (e.g. to the
+# keepa_replay stub) and "keepa_record_dir" saves each response for later replay.
+import json
+import logging
+import sys
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from keepa_replay import record_response
+
+API_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/90.0.4430.212',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+POOL_CONNECTIONS = 2  # api.keepa.com only
+POOL_MAXSIZE = 10
+
+KEEPA_API_URL = 'https://api.keepa.com'
+
+# Load record/replay settings
+try:
+    with open('config.json') as f:
+        config = json.load(f)
+except Exception as e:
+    logging.error("Session config load failed: %s", e)
+    config = {}
+
+API_URL = config.get('keepa_api_url', KEEPA_API_URL).rstrip('/')
+RECORD_DIR = config.get('keepa_record_dir', '')
+
+_local = threading.local()
+_adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+
+class KeepaSession(requests.Session):
+    # Call sites keep their https://api.keepa.com URLs; the base is swapped here
+    def request(self, method, url, *args, **kwargs):
+        if API_URL != KEEPA_API_URL and url.startswith(KEEPA_API_URL):
+            url = API_URL + url[len(KEEPA_API_URL):]
+        return super().request(method, url, *args, **kwargs)
+
+def get_session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = KeepaSession()
+        session.headers.update(API_HEADERS)
+        if RECORD_DIR:
+            session.hooks['response'].append(lambda response, *args, **kwargs: record_response(response, RECORD_DIR))
+        session.mount('https://', _adapter)
+        session.mount('http://', _adapter)
+        _local.session = session
+        logging.debug("Created HTTP session for thread %s", threading.current_thread().name)
+    return session
+
+# keepa.Keepa calls requests.get directly; this stands in for its `requests` module so the
+# client goes through the shared sessions too. Everything else falls through to requests.
+class _KeepaRequests:
+    def get(self, url, params=None, **kwargs):
+        return get_session().get(url, params=params, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+def use_for_keepa_client():
+    # keepa.interface (1.3.x) and keepa.keepa_sync (1.6+) hold the module-level requests reference
+    for name in ('keepa.interface', 'keepa.keepa_sync'):
+        module = sys.modules.get(name)
+        if module is not None and getattr(module, 'requests', None) is requests:
+            module.requests = _KeepaRequests()
+            logging.debug("Routed %s through shared HTTP session", name)
+
+# One keepa.Keepa client per run: building one costs a /token round trip. keepa is optional and
+# only imported when a client call actually happens.
+_client = None
+_client_lock = threading.Lock()
+
+def get_keepa_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from keepa import Keepa
+            use_for_keepa_client()
+            _client = Keepa(config['api_key'])
+            logging.info("Created keepa client")
+        return _client
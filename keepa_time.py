@@ -0,0 +1,39 @@
+# keepa_time.py
+# Keepa-minute timestamp conversion. Keepa times are minutes since 2011-01-01 UTC; columns show
+# America/Toronto local time. The zone's UTC offsets are precomputed once as a DST transition
+# table (in Keepa minutes), so a whole batch converts with one searchsorted and datetime64 math.
+from datetime import datetime
+import numpy as np
+from pytz import timezone
+
+KEEPA_EPOCH = datetime(2011, 1, 1)
+KEEPA_EPOCH64 = np.datetime64('2011-01-01T00:00', 'm')
+TORONTO_TZ = timezone('America/Toronto')
+MIN_VALID_MINUTES = 100000  # Values at or below this are placeholders, shown as '-'
+
+def _transition_table(tz):
+    # pytz keeps the zone's UTC transition times and (utcoffset, dst, name) for each period
+    starts = []
+    offsets = []
+    for when, (utcoffset, _, _) in zip(tz._utc_transition_times, tz._transition_info):
+        starts.append(int((when - KEEPA_EPOCH).total_seconds() // 60) if when.year > 1 else np.iinfo(np.int64).min)
+        offsets.append(int(utcoffset.total_seconds() // 60))
+    return np.array(starts, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+TRANSITION_STARTS, TRANSITION_OFFSETS = _transition_table(TORONTO_TZ)
+
+def local_minutes(minutes):
+    minutes = np.asarray(minutes, dtype=np.int64)
+    period = np.searchsorted(TRANSITION_STARTS, minutes, side='right') - 1
+    return minutes + TRANSITION_OFFSETS[np.maximum(period, 0)]
+
+def format_keepa_minutes(minutes, date_only=False, min_valid=MIN_VALID_MINUTES):
+    # Bulk version: list of 'YYYY-MM-DD HH:MM:SS' (or 'YYYY-MM-DD') strings, '-' for invalid values
+    minutes = np.asarray(minutes, dtype=np.int64)
+    valid = minutes > min_valid
+    stamps = KEEPA_EPOCH64 + local_minutes(np.where(valid, minutes, 0)).astype('timedelta64[m]')
+    if date_only:
+        text = np.datetime_as_string(stamps, unit='D')
+    else:
+        text = np.char.replace(np.datetime_as_string(stamps, unit='s'), 'T', ' ')
+    return np.where(valid, text, '-').tolist()
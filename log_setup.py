@@ -0,0 +1,84 @@
+# log_setup.py
+# Logging for a run. Records are handed to a queue and written to a size-rotated debug_log.txt by
+# a background listener thread, so worker threads never wait on file I/O. "production" mode logs
+# INFO and up; "debug" mode keeps the per-ASIN DEBUG trace, optionally for a sample of ASINs only.
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import queue
+import zlib
+
+LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s'
+_trace_asin = contextvars.ContextVar('trace_asin', default=None)
+_listener = None
+_handlers = []
+_worker_config = (logging.DEBUG, 1.0)
+_process_listeners = []
+
+def set_trace_asin(asin):
+    # Marks the ASIN the current thread/task is working on, for DEBUG sampling
+    _trace_asin.set(asin)
+
+def asin_sampled(asin, rate):
+    # Stable per ASIN: the same ASINs are traced on every run at a given rate
+    return zlib.crc32(asin.encode('utf-8')) % 10000 < rate * 10000
+
+class AsinSampleFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        asin = _trace_asin.get()
+        return asin is None or asin_sampled(asin, self.rate)
+
+def configure_logging(mode='debug', sample_rate=1.0, path='debug_log.txt', max_bytes=50 * 1024 * 1024, backup_count=3):
+    global _listener, _worker_config
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if mode == 'debug' and sample_rate < 1.0:
+        queue_handler.addFilter(AsinSampleFilter(sample_rate))
+    root.addHandler(queue_handler)
+    root.setLevel(logging.DEBUG if mode == 'debug' else logging.INFO)
+    _handlers[:] = [file_handler]
+    _worker_config = (root.level, sample_rate if mode == 'debug' else 1.0)
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def process_log_config(context):
+    # For worker processes (row_pool.py): a process-safe queue drained into the same log file by a
+    # second listener, plus the level and sample rate. Pass the result to configure_worker_logging.
+    log_queue = context.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *_handlers)
+    listener.start()
+    _process_listeners.append(listener)
+    return (log_queue,) + _worker_config
+
+def configure_worker_logging(log_queue, level, sample_rate):
+    # Runs in the worker; drops whatever handlers the worker inherited from the parent
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if sample_rate < 1.0:
+        queue_handler.addFilter(AsinSampleFilter(sample_rate))
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+def stop_logging():
+    # Flushes queued records to the file; safe to call more than once
+    global _listener
+    while _process_listeners:
+        _process_listeners.pop().stop()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
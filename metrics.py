@@ -0,0 +1,118 @@
+# metrics.py
+# Run metrics: monotonic timers and counters per pipeline stage (deal fetch, product fetch, row
+# building, CSV writing) and per FUNCTION_LIST extractor. At the end of a run report() prints a
+# summary table and writes run_metrics.json, so slow stages and expensive columns show up without
+# a profiler. Thread-safe; worker threads record into the shared module-level `metrics`.
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+import numpy as np
+
+FIELD_TABLE_ROWS = 15  # Extractors shown in the printed table (all of them go to the JSON file)
+
+def peak_rss_mb():
+    # Peak resident memory of this process so far (worker processes not included)
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+    except ImportError:
+        return None
+
+class RunMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.fields = {}
+
+    def record(self, stage, seconds, **counts):
+        with self._lock:
+            self.stages.setdefault(stage, []).append(seconds)
+            if counts:
+                stage_counts = self.counters.setdefault(stage, {})
+                for key, value in counts.items():
+                    stage_counts[key] = stage_counts.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, stage, **counts):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, **counts)
+
+    def record_fields(self, timings):
+        # timings: [(extractor name, seconds)] for one row, recorded under one lock
+        # Compact float arrays: a 100k-row run records millions of extractor timings
+        with self._lock:
+            for name, seconds in timings:
+                durations = self.fields.get(name)
+                if durations is None:
+                    durations = self.fields[name] = array('d')
+                durations.append(seconds)
+
+    def drain(self):
+        # Hands over everything recorded so far and starts empty; row_pool workers send this back per chunk
+        with self._lock:
+            data = (self.stages, self.counters, self.fields)
+            self.stages, self.counters, self.fields = {}, {}, {}
+        return data
+
+    def merge(self, data):
+        stages, counters, fields = data
+        with self._lock:
+            for stage, durations in stages.items():
+                self.stages.setdefault(stage, []).extend(durations)
+            for stage, counts in counters.items():
+                stage_counts = self.counters.setdefault(stage, {})
+                for key, value in counts.items():
+                    stage_counts[key] = stage_counts.get(key, 0) + value
+            for name, durations in fields.items():
+                self.fields.setdefault(name, array('d')).extend(durations)
+
+    @staticmethod
+    def _summarize(durations):
+        values = np.asarray(durations, dtype=np.float64) * 1000
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]).tolist()
+        return {'count': len(values), 'total_s': round(float(values.sum()) / 1000, 4), 'mean_ms': round(float(values.mean()), 4),
+                'p50_ms': round(p50, 4), 'p95_ms': round(p95, 4), 'p99_ms': round(p99, 4)}
+
+    def summary(self, extra=None):
+        with self._lock:
+            stages = {stage: dict(self._summarize(durations), **self.counters.get(stage, {})) for stage, durations in self.stages.items()}
+            fields = {name: self._summarize(durations) for name, durations in self.fields.items()}
+        fields = dict(sorted(fields.items(), key=lambda item: item[1]['total_s'], reverse=True))
+        return {'wall_s': round(time.perf_counter() - self.started, 3), 'stages': stages, 'fields': fields, 'totals': extra or {}}
+
+    def report(self, path='run_metrics.json', extra=None):
+        data = self.summary(extra)
+        lines = [f"Run metrics (wall {data['wall_s']:.2f}s)",
+                 f"{'stage':<36}{'count':>8}{'total s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+        for title, table in (('', data['stages']), ('extractor', dict(list(data['fields'].items())[:FIELD_TABLE_ROWS]))):
+            if title and table:
+                lines.append(f"-- slowest extractors (of {len(data['fields'])}) --")
+            for name, s in table.items():
+                lines.append(f"{name[:35]:<36}{s['count']:>8}{s['total_s']:>10.3f}{s['p50_ms']:>10.3f}{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}")
+        for stage, s in data['stages'].items():
+            counts = {k: v for k, v in s.items() if k not in ('count', 'total_s', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')}
+            if counts:
+                lines.append(f"{stage}: " + ', '.join(f"{k}={v}" for k, v in counts.items()))
+        if data['totals']:
+            lines.append(', '.join(f"{k}={v}" for k, v in data['totals'].items()))
+        print('\n'.join(lines))
+        logging.info("Run metrics: wall %.2fs, %s stages, %s extractors", data['wall_s'], len(data['stages']), len(data['fields']))
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.error("Run metrics write failed: %s", e)
+        return data
+
+metrics = RunMetrics()
@@ -0,0 +1,67 @@
+# offer_index.py
+# One pass over a product's `offers` list for every offer-derived column. Offers are bucketed by
+# (condition, channel), channel being 'FBA' or 'FBM', plus a (condition, None) bucket across both;
+# each bucket keeps its offers, their prices in cents (-1 when absent), the offer count and the
+# lowest positive price. offerCSV ([keepaMinute, price, shipping, ...]) is only decoded when a
+# column asks for an offer's price history. The index is cached on the product under '_offers',
+# the way history.py caches decoded csv series under '_history'.
+from stable_deals import MISSING
+
+class OfferBucket:
+    __slots__ = ('offers', 'prices', 'min_price')
+
+    def __init__(self):
+        self.offers = []
+        self.prices = []
+        self.min_price = MISSING
+
+    def add(self, offer, price):
+        self.offers.append(offer)
+        self.prices.append(price)
+        if price > 0 and (self.min_price is MISSING or price < self.min_price):
+            self.min_price = price
+
+    @property
+    def count(self):
+        return len(self.offers)
+
+EMPTY_BUCKET = OfferBucket()
+
+class OfferIndex:
+    def __init__(self, offers):
+        self.offers = offers
+        self.buckets = {}
+        self._csv = {}
+        for offer in offers:
+            price = offer.get('price', -1)
+            if not isinstance(price, (int, float)):
+                price = -1
+            # Same split as the original columns: truthy isFBA is FBA, isFBA False (or absent) is FBM
+            is_fba = offer.get('isFBA', False)
+            channel = 'FBA' if is_fba else 'FBM' if is_fba is False else None
+            condition = offer.get('condition')
+            keys = ((condition, None), (condition, channel)) if channel else ((condition, None),)
+            for key in keys:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = OfferBucket()
+                bucket.add(offer, price)
+
+    def bucket(self, condition, channel=None):
+        # channel: 'FBA', 'FBM' or None for both; read-only, an empty bucket when nothing matches
+        return self.buckets.get((condition, channel), EMPTY_BUCKET)
+
+    def offer_history(self, offer):
+        # (times, price + shipping in cents) for one offer's offerCSV, decoded once
+        key = id(offer)
+        series = self._csv.get(key)
+        if series is None:
+            from history import decode_series  # history imports stable_products, which imports this module
+            series = self._csv[key] = decode_series(offer.get('offerCSV'), with_shipping=True)
+        return series
+
+def offer_index(product):
+    index = product.get('_offers')
+    if index is None:
+        index = product['_offers'] = OfferIndex(product.get('offers') or [])
+    return index
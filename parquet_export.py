@@ -0,0 +1,178 @@
+# parquet_export.py
+# Typed columnar copy of the export (config "parquet_export"). The CSV gets presentation strings
+# from column_formats; here the raw values get a real type: prices as integer cents, ranks and
+# counts as integers, percentages and ratings as floats, Keepa timestamps as datetimes
+# (America/Toronto local, as in the CSV), low-cardinality text as dictionary-encoded categories.
+# Missing values are null. Display strings (text extractors, rows from an older run_state.json)
+# are parsed back, so both kinds of row land in the same column types.
+# Rows are buffered into row groups and written with pyarrow, so memory stays bounded.
+import logging
+import os
+import pandas as pd
+from column_formats import COLUMN_FORMATS
+from keepa_time import KEEPA_EPOCH64, local_minutes
+from stable_products import STAT_SPECS
+from history import WINDOW_SPECS
+from stats_batch import LEGACY_SPECS, TIMESTAMP_SPECS
+
+# Columns outside the spec tables; anything not listed here or in a table is plain text
+EXTRA_TYPES = {
+    'Percent Down 90': 'percent',
+    'Percent Down 365': 'percent',
+    'Avg. Price 90': 'price',
+    'Avg. Price 365': 'price',
+    'Price Now': 'price',
+    'FBA Pick&Pack Fee': 'price',
+    'Referral Fee %': 'percent',
+    'Sales Rank - Reference': 'category',
+    'Price Now Source': 'category',
+    'Categories - Root': 'category',
+    'Categories - Sub': 'category',
+    'Categories - Tree': 'category',
+    'ASIN': 'asin',
+    'Type': 'category',
+    'Manufacturer': 'category',
+    'Brand': 'category',
+    'Product Group': 'category',
+    'Item Type': 'category',
+    'Binding': 'category',
+    'Format': 'category',
+    'Languages': 'category',
+    'Number of Items': 'count',
+    'Number of Pages': 'count',
+    'Package - Quantity': 'count',
+    'Package Weight': 'measure',
+    'Package Height': 'measure',
+    'Package Length': 'measure',
+    'Package Width': 'measure',
+    'Publication Date': 'date',
+    'Release Date': 'date',
+    'Sales Rank - Drops last 30 days': 'count',
+    'Sales Rank - Drops last 365 days': 'count',
+    'Amazon - Current': 'price',
+    'New, 3rd Party FBA - Current': 'price',
+    'New, 3rd Party FBM - Current': 'price',
+    'Buy Box Used - Current': 'price',
+}
+UNITS = {'Package Weight': 'kg', 'Package Height': 'cm', 'Package Length': 'cm', 'Package Width': 'cm'}
+
+def column_types(headers):
+    types = {}
+    for header, *_, kind in STAT_SPECS:
+        types[header] = kind
+    for header, *_, kind in WINDOW_SPECS:
+        types[header] = kind
+    for _, header, _, _, _, kind, _ in LEGACY_SPECS:
+        types[header] = kind
+    for _, header, _, _, date_only, _ in TIMESTAMP_SPECS:
+        types[header] = 'date' if date_only else 'timestamp'
+    for header in headers:
+        if header.endswith(' - Stock'):
+            types.setdefault(header, 'count')
+    types.update(EXTRA_TYPES)
+    return {header: types.get(header, 'text') for header in headers}
+
+def _is_text(series):
+    return series.map(lambda value: isinstance(value, str)).astype(bool)
+
+def _numbers(values, strip, raw_scale, text_scale=1):
+    # Raw numbers are scaled into the column's unit; '$1,203.55' / '1,012,267' / '82%' / '0.72 kg'
+    # are parsed; None, '-' and unparseable -> NaN
+    series = pd.Series(values, dtype=object)
+    text = _is_text(series)
+    numbers = pd.to_numeric(series.where(~text), errors='coerce') * raw_scale
+    if text.any():
+        parsed = series.where(text & (series != '-')).str.replace(strip, '', regex=True)
+        numbers = numbers.where(~text, pd.to_numeric(parsed, errors='coerce') * text_scale)
+    return numbers
+
+def _timestamps(values):
+    # Keepa minutes -> local datetimes; 'YYYY-MM-DD[ HH:MM:SS]' strings are parsed
+    series = pd.Series(values, dtype=object)
+    text = _is_text(series)
+    stamps = pd.to_datetime(series.where(text & (series != '-')), errors='coerce', format='ISO8601').astype('datetime64[s]')
+    minutes = ~text & series.notna()
+    if minutes.any():
+        local = KEEPA_EPOCH64 + local_minutes(series[minutes].astype('int64')).astype('timedelta64[m]')
+        stamps[minutes] = local.astype('datetime64[s]')
+    return stamps
+
+def convert_column(kind, values, divisor=1):
+    # divisor: Keepa units per display unit (100 for cent prices, 10 for rating and cm, ...)
+    if kind == 'price':
+        return _numbers(values, r'[$,]', 100 / divisor, 100).round().astype('Int64')
+    if kind == 'count':
+        return _numbers(values, ',', 1 / divisor).round().astype('Int64')
+    if kind == 'percent':
+        return _numbers(values, '[%,]', 1).astype('float64')
+    if kind in ('rating', 'measure'):
+        return _numbers(values, r'[^0-9.\-]', 1 / divisor).astype('float64')
+    if kind in ('timestamp', 'date'):
+        stamps = _timestamps(values)
+        return stamps.dt.normalize() if kind == 'date' else stamps
+    series = pd.Series(values, dtype=object)
+    series = series.where(series != '-')
+    if kind == 'asin':
+        series = series.str.removeprefix('="').str.removesuffix('"')
+    return series.astype('category' if kind == 'category' else 'string')
+
+def arrow_type(pa, kind):
+    return {
+        'price': pa.int64(), 'count': pa.int64(), 'percent': pa.float64(), 'rating': pa.float64(), 'measure': pa.float64(),
+        'timestamp': pa.timestamp('s'), 'date': pa.date32(), 'category': pa.dictionary(pa.int32(), pa.string()),
+    }.get(kind, pa.string())
+
+class ParquetSink:
+    def __init__(self, path, headers, row_group_size=10000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.headers = list(headers)
+        self.types = column_types(self.headers)
+        self.divisors = {h: COLUMN_FORMATS.get(h, (None, 1))[1] for h in self.headers}
+        self.row_group_size = row_group_size
+        metadata = {'keepa_deals.column_types': ','.join(self.types[h] for h in self.headers),
+                    'keepa_deals.units': ','.join(f"{h}={u}" for h, u in UNITS.items()),
+                    'keepa_deals.timezone': 'America/Toronto'}
+        self.schema = pa.schema([pa.field(h, arrow_type(pa, self.types[h])) for h in self.headers], metadata=metadata)
+        self._writer = pq.ParquetWriter(self.tmp_path, self.schema, compression='zstd')
+        self._buffer = []
+        self.written = 0
+
+    def add(self, values):
+        # values: one raw row in header order (None for missing cells)
+        self._buffer.append(values)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        pa = self._pa
+        columns = list(zip(*self._buffer))
+        arrays = []
+        for header, values in zip(self.headers, columns):
+            kind = self.types[header]
+            series = convert_column(kind, list(values), self.divisors[header])
+            if kind == 'date':
+                series = series.dt.date
+            arrays.append(pa.array(series, type=arrow_type(pa, kind), from_pandas=True))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.written += len(self._buffer)
+        self._buffer = []
+
+    def commit(self):
+        self._flush()
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+        logging.info("Parquet written: %s (%s rows)", self.path, self.written)
+        print(f"Parquet written: {self.path} ({self.written} rows)")
+
+    def abort(self):
+        try:
+            self._writer.close()
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
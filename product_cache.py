@@ -0,0 +1,114 @@
+# product_cache.py
+# Persistent SQLite cache of /product responses, keyed by ASIN plus request parameters.
+# Entries expire after a TTL, the least recently used entries are evicted past a size limit,
+# and an entry is stale when the deal's lastUpdate is newer than the cached product.
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+KEEPA_EPOCH_UNIX = 1293840000  # 2011-01-01 00:00 UTC
+
+# Load cache settings
+try:
+    with open('config.json') as f:
+        config = json.load(f)
+except Exception as e:
+    logging.error("Cache config load failed: %s", e)
+    config = {}
+
+CACHE_ENABLED = bool(config.get('product_cache', True))
+CACHE_PATH = config.get('product_cache_path', 'product_cache.sqlite')
+CACHE_TTL = float(config.get('product_cache_ttl_hours', 12)) * 3600
+CACHE_MAX_ENTRIES = int(config.get('product_cache_max_entries', 50000))
+
+def params_key(**params):
+    return '&'.join(f"{k}={params[k]}" for k in sorted(params))
+
+def keepa_minutes_now():
+    return int((time.time() - KEEPA_EPOCH_UNIX) / 60)
+
+class ProductCache:
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS products (
+            asin TEXT NOT NULL,
+            params TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            product_ts INTEGER NOT NULL,
+            last_access REAL NOT NULL,
+            body BLOB NOT NULL,
+            PRIMARY KEY (asin, params))''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_products_last_access ON products (last_access)')
+        self._conn.commit()
+
+    # Returns {asin: product} for fresh entries. min_ts maps ASIN -> deal lastUpdate (Keepa minutes).
+    def get_many(self, asins, params, min_ts=None):
+        min_ts = min_ts or {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            for asin in asins:
+                row = self._conn.execute('SELECT fetched_at, product_ts, body FROM products WHERE asin = ? AND params = ?', (asin, params)).fetchone()
+                if row is None:
+                    continue
+                fetched_at, product_ts, body = row
+                if now - fetched_at > self.ttl:
+                    logging.debug("Cache expired for ASIN %s", asin)
+                    continue
+                if (min_ts.get(asin) or 0) > product_ts:
+                    logging.debug("Cache stale for ASIN %s: deal lastUpdate=%s > cached=%s", asin, min_ts.get(asin), product_ts)
+                    continue
+                found[asin] = json.loads(zlib.decompress(body))
+            if found:
+                self._conn.executemany('UPDATE products SET last_access = ? WHERE asin = ? AND params = ?', [(now, asin, params) for asin in found])
+                self._conn.commit()
+        self.hits += len(found)
+        self.misses += len(asins) - len(found)
+        return found
+
+    def put_many(self, products, params):
+        now = time.time()
+        records = []
+        for asin, product in products.items():
+            try:
+                body = zlib.compress(json.dumps(product, separators=(',', ':')).encode('utf-8'))
+            except (TypeError, ValueError) as e:
+                logging.warning("Not caching ASIN %s: %s", asin, e)
+                continue
+            # A product is as fresh as Keepa's own lastUpdate, or the fetch time if that is missing
+            product_ts = product.get('lastUpdate') or keepa_minutes_now()
+            records.append((asin, params, now, product_ts, now, body))
+        if not records:
+            return
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?)', records)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        if count <= self.max_entries:
+            return
+        self._conn.execute('DELETE FROM products WHERE rowid IN (SELECT rowid FROM products ORDER BY last_access LIMIT ?)', (count - self.max_entries,))
+        logging.info("Product cache evicted %s least recently used entries", count - self.max_entries)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Module-level cache shared by the HTTP path and the keepa client fallback
+try:
+    cache = ProductCache() if CACHE_ENABLED else None
+except sqlite3.Error as e:
+    logging.error("Product cache disabled, could not open %s: %s", CACHE_PATH, e)
+    cache = None
@@ -0,0 +1,161 @@
+# row_pool.py
+# Row computation: FUNCTION_LIST extraction (plus stats_batch in batch mode) for a list of
+# (deal, product) pairs. With config "row_workers" set, build_rows hands each product batch to a
+# ProcessPoolExecutor in chunks of "row_chunk_size" pairs. Every worker compiles the extraction
+# plan once in its initializer and returns rows as tuples over the plan's headers (no per-row
+# dict keys to pickle) together with its metrics; chunks are collected in submission order, so
+# the CSV comes out in the same order as a single-process run.
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from field_mappings import compile_plan, extract_row
+from log_setup import process_log_config, configure_worker_logging
+from metrics import metrics
+from stable_deals import MISSING
+from stats_batch import BATCH_FUNCS, batch_stat_columns, batch_timestamp_columns
+
+# Product sections only the extractors read; memory-lean mode drops them once a product's row is built
+PAYLOAD_SECTIONS = ('offers', 'csv', 'stats', 'categoryTree', 'salesRanks', 'buyBoxUsedHistory', 'liveOffersOrder',
+                    'variations', 'description', 'features', 'imagesCSV', '_history', '_offers')
+
+def release_payload(product):
+    for section in PAYLOAD_SECTIONS:
+        product.pop(section, None)
+
+def compute_rows(pairs, plan, row_plan, batch_stats, release=False):
+    # One raw row dict per pair, None where the row could not be built. In batch_stats mode the
+    # stats columns for the whole list come from stats_batch and row_plan covers the rest.
+    # release: drop each product's payload as soon as its row is done (memory-lean mode).
+    stat_rows = None
+    if batch_stats:
+        try:
+            with metrics.timer('batch stats', products=len(pairs)):
+                stat_rows = batch_stat_columns([product for _, product in pairs])
+                for stat_row, time_row in zip(stat_rows, batch_timestamp_columns([deal for deal, _ in pairs], [product for _, product in pairs])):
+                    stat_row.update(time_row)
+        except Exception as e:
+            logging.error("Batch stats failed, using per-product extractors: %s", e)
+    rows = []
+    for i, (deal, product) in enumerate(pairs):
+        try:
+            if stat_rows is None:
+                row = extract_row(plan, deal, product)
+            else:
+                row = extract_row(row_plan, deal, product)
+                row.update(stat_rows[i])
+        except Exception as e:
+            logging.error("Error processing ASIN %s: %s", deal['asin'], e)
+            row = None
+        if release:
+            release_payload(product)
+        rows.append(row)
+    return rows
+
+def plan_headers(headers, plan):
+    # Headers the plan fills, in header order: the layout of a row tuple
+    covered = {header for func_headers, _, _ in plan for header in func_headers}
+    return tuple(header for header in headers if header in covered)
+
+def record_type(headers):
+    # Compact row for memory-lean mode: one tuple over `headers` behind the parts of the dict
+    # interface the CSV/Parquet sinks, run state and deal store use (dict(record) converts back).
+    # A 180-column row takes ~1.5 KB this way instead of ~6.5 KB for the dict alone.
+    headers = tuple(headers)
+    index = {header: i for i, header in enumerate(headers)}
+
+    class RowRecord:
+        __slots__ = ('values',)
+        HEADERS = headers
+
+        def __init__(self, values):
+            self.values = tuple(values)
+
+        @classmethod
+        def from_dict(cls, row):
+            return cls(row.get(header, MISSING) for header in headers)
+
+        def get(self, header, default=None):
+            i = index.get(header)
+            return default if i is None else self.values[i]
+
+        def __getitem__(self, header):
+            return self.values[index[header]]
+
+        def __setitem__(self, header, value):
+            # Rare (late patches such as buy_box_fallback); the tuple is rebuilt
+            i = index[header]
+            self.values = self.values[:i] + (value,) + self.values[i + 1:]
+
+        def __contains__(self, header):
+            return header in index
+
+        def __len__(self):
+            return len(headers)
+
+        def keys(self):
+            return headers
+
+    return RowRecord
+
+# Worker process starts
+_worker = {}
+
+def _init_worker(headers, batch_stats, log_queue, log_level, sample_rate):
+    configure_worker_logging(log_queue, log_level, sample_rate)
+    plan = compile_plan(headers)
+    _worker.update(headers=plan_headers(headers, plan), batch_stats=batch_stats, plan=plan,
+                   row_plan=compile_plan(headers, exclude=BATCH_FUNCS) if batch_stats else plan)
+    metrics.drain()  # Nothing recorded before the first chunk belongs to the run
+
+def _build_chunk(pairs):
+    headers = _worker['headers']
+    rows = compute_rows(pairs, _worker['plan'], _worker['row_plan'], _worker['batch_stats'])
+    values = [None if row is None else tuple(row.get(header, MISSING) for header in headers) for row in rows]
+    return values, metrics.drain()
+# Worker process ends
+
+class RowPool:
+    def __init__(self, workers, chunk_size, headers, plan, batch_stats, row_type=None):
+        # fork where the platform has it: spawn would re-run Keepa_Deals' startup in every worker
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self.workers = workers
+        self.chunk_size = chunk_size  # 0 = split each batch evenly across the workers
+        self.headers = plan_headers(headers, plan)
+        self.row_type = row_type  # record_type over self.headers: worker tuples are wrapped as they are
+        self.executor = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                            initargs=(list(headers), batch_stats, *process_log_config(context)))
+        logging.info("Row pool: %s workers, chunk size %s", workers, chunk_size or 'auto')
+
+    def compute(self, pairs):
+        # Same result as compute_rows, in the same order
+        size = self.chunk_size or max(math.ceil(len(pairs) / self.workers), 1)
+        futures = [self.executor.submit(_build_chunk, pairs[i:i + size]) for i in range(0, len(pairs), size)]
+        rows = []
+        for future in futures:
+            values, worker_metrics = future.result()
+            metrics.merge(worker_metrics)
+            if self.row_type is not None:
+                rows.extend(None if row is None else self.row_type(row) for row in values)
+            else:
+                rows.extend(None if row is None else dict(zip(self.headers, row)) for row in values)
+        return rows
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+# Module-level pool, started by Keepa_Deals.main when "row_workers" is set
+pool = None
+
+def start(workers, chunk_size, headers, plan, batch_stats, row_type=None):
+    global pool
+    if workers > 0 and pool is None:
+        pool = RowPool(workers, chunk_size, headers, plan, batch_stats, row_type)
+    return pool
+
+def stop():
+    global pool
+    if pool is not None:
+        pool.close()
+        pool = None
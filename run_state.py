@@ -0,0 +1,53 @@
+# run_state.py
+# Incremental runs: the previous run's rows keyed by ASIN, together with the deal fields that
+# change when Keepa sees a new price (lastUpdate and currentSince[11]). Deals whose signature
+# matches the stored one reuse the stored row instead of a product fetch and FUNCTION_LIST pass.
+import json
+import logging
+import os
+
+def deal_signature(deal):
+    current_since = deal.get('currentSince') or []
+    return [deal.get('lastUpdate', 0), current_since[11] if len(current_since) > 11 else -1]
+
+class RunState:
+    def __init__(self, path, row_type=None):
+        # row_type: row_pool.record_type class; loaded rows are kept as compact records (memory-lean mode)
+        self.path = path
+        self.previous = {}
+        self.current = {}
+        self.reused = 0
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.previous = json.load(f).get('rows', {})
+            if row_type is not None:
+                for entry in self.previous.values():
+                    entry['row'] = row_type.from_dict(entry['row'])
+            logging.info("Loaded run state for %s ASINs from %s", len(self.previous), path)
+        except FileNotFoundError:
+            logging.info("No run state at %s, computing every deal", path)
+        except Exception as e:
+            logging.error("Run state load failed, computing every deal: %s", e)
+
+    # Returns the stored row when the deal has not changed since the last run, else None
+    def unchanged_row(self, deal):
+        entry = self.previous.get(deal.get('asin'))
+        if entry is None or entry['signature'] != deal_signature(deal):
+            return None
+        self.reused += 1
+        self.current[deal['asin']] = entry
+        return entry['row']
+
+    def record(self, deal, row):
+        self.current[deal['asin']] = {'signature': deal_signature(deal), 'row': row}
+
+    def save(self):
+        # Only ASINs seen in this run are carried forward
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'rows': self.current}, f, separators=(',', ':'), default=dict)  # default: compact records
+            os.replace(tmp_path, self.path)
+            logging.info("Run state saved for %s ASINs (%s reused)", len(self.current), self.reused)
+        except Exception as e:
+            logging.error("Run state save failed: %s", e)
@@ -1,39 +1,39 @@
 # stable_deals.py force change window
 import logging
-import requests
 import json
+import time
 import urllib.parse
-from retrying import retry
-from datetime import datetime, timedelta
-from pytz import timezone
+from concurrent.futures import ThreadPoolExecutor
+from token_scheduler import scheduler, estimate_deal_cost
+from keepa_session import get_session
+from keepa_time import MIN_VALID_MINUTES
+from metrics import metrics
 
-# Configure logging
-logging.basicConfig(filename='debug_log.txt', level=logging.DEBUG, format='%(asctime)s %(levelname)s: %(message)s')
+MISSING = None  # Raw value of an empty cell; column_formats renders it as '-'
 
-# Constants
-KEEPA_EPOCH = datetime(2011, 1, 1)
-TORONTO_TZ = timezone('America/Toronto')
+# Logging is configured by the entry point (log_setup.configure_logging)
 
 # Load API key
 try:
     with open('config.json') as f:
         config = json.load(f)
         api_key = config['api_key']
-        logging.debug(f"API key loaded: {api_key[:5]}...")
+        logging.debug("API key loaded: %s...", api_key[:5])
 except Exception as e:
-    logging.error(f"API key load failed: {str(e)}")
+    logging.error("API key load failed: %s", e)
     raise SystemExit(1)
 
 def validate_asin(asin):
     if not isinstance(asin, str) or len(asin) != 10 or not asin.isalnum():
-        logging.error(f"Invalid ASIN format: {asin}")
+        logging.error("Invalid ASIN format: %s", asin)
         return False
     return True
 
 # Do not modify fetch_deals_for_deals! It mirrors the "Show API query" (https://api.keepa.com/deal), with critical parameters.
-@retry(stop_max_attempt_number=3, wait_fixed=5000)
+# 2026-10-18: A failed page returns None instead of [] (query unchanged), so iter_deals can tell it from the end of the deals.
+# 2026-10-18: Dropped @retry: the 429 loop retries and every exception is caught, so it never fired.
 def fetch_deals_for_deals(page):
-    logging.debug(f"Fetching deals page {page} for Percent Down 90...")
+    logging.debug("Fetching deals page %s for Percent Down 90...", page)
     print(f"Fetching deals page {page} for Percent Down 90...")
     deal_query = {
         "page": page,
@@ -63,73 +63,101 @@ def fetch_deals_for_deals(page):
         "dateRange": "3"
     }
     query_json = json.dumps(deal_query, separators=(',', ':'), sort_keys=True)
-    logging.debug(f"Raw query JSON: {query_json}")
+    logging.debug("Raw query JSON: %s", query_json)
     encoded_selection = urllib.parse.quote(query_json)
     url = f"https://api.keepa.com/deal?key={api_key}&selection={encoded_selection}"
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/90.0.4430.212'}
-    logging.debug(f"Deal URL: {url}")
+    logging.debug("Deal URL: %s", url)
     try:
-        response = requests.get(url, headers=headers, timeout=30)
-        logging.debug(f"Full deal response: {response.text}")
+        for attempt in range(3):
+            scheduler.acquire(estimate_deal_cost())
+            start = time.perf_counter()
+            response = get_session().get(url, timeout=30)
+            fetch_seconds = time.perf_counter() - start
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("Full deal response: %s", response.text)
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            scheduler.update(data)
+            metrics.record('deal fetch', fetch_seconds, bytes=len(response.content), tokens=data.get('tokensConsumed', 0) or 0)
+            if response.status_code != 429:
+                break
+            logging.warning("Token limit hit fetching deals page %s (attempt %s), waiting for refill", page, attempt+1)
         if response.status_code != 200:
-            logging.error(f"Deal fetch failed: {response.status_code}, {response.text}")
+            logging.error("Deal fetch failed: %s, %s", response.status_code, response.text)
             print(f"Deal fetch failed: {response.status_code}, {response.text}")
-            return []
-        data = response.json()
+            return None
         deals = data.get('deals', {}).get('dr', [])
-        logging.debug(f"Fetched {len(deals)} deals: {[d.get('asin', '-') for d in deals]}")
-        logging.debug(f"Deal response structure: {list(data.get('deals', {}).keys())}")
-        logging.debug(f"All deal keys: {[list(d.keys()) for d in deals]}")
-        logging.debug(f"Deals data: {[{'asin': d.get('asin', '-'), 'current': d.get('current', []), 'current[9]': d.get('current', [-1] * 20)[9] if len(d.get('current', [])) > 9 else -1, 'current[1]': d.get('current', [-1] * 20)[1] if len(d.get('current', [])) > 1 else -1} for d in deals]}")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Fetched %s deals: %s", len(deals), [d.get('asin', '-') for d in deals])
+            logging.debug("Deal response structure: %s", list(data.get('deals', {}).keys()))
+            logging.debug("All deal keys: %s", [list(d.keys()) for d in deals])
+            logging.debug("Deals data: %s", [{'asin': d.get('asin', '-'), 'current': d.get('current', []), 'current[9]': d.get('current', [-1] * 20)[9] if len(d.get('current', [])) > 9 else -1, 'current[1]': d.get('current', [-1] * 20)[1] if len(d.get('current', [])) > 1 else -1} for d in deals])
         print(f"Fetched {len(deals)} deals")
-        return deals[:10]
+        return deals
     except Exception as e:
-        logging.error(f"Deal fetch exception: {str(e)}")
+        logging.error("Deal fetch exception: %s", e)
         print(f"Deal fetch exception: {str(e)}")
-        return []
-        
+        return None
+
+# Deal pages starts
+# Walks page=0,1,2,... with the unchanged fetch_deals_for_deals query and yields deals as each
+# page arrives. The next page is requested in the background while the current one is consumed.
+# A failed page raises RuntimeError, so the run stops instead of exporting a partial deal list as
+# if Keepa had run out of deals (the CSV export, run state and deal store are then left as they were).
+DEAL_PAGE_SIZE = 150  # Keepa returns up to 150 deals per page
+
+def iter_deals(max_pages=None, max_deals=None):
+    yielded = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(fetch_deals_for_deals, 0)
+        page = 0
+        while pending is not None:
+            deals = pending.result()
+            if deals is None:
+                raise RuntimeError(f"Deal page {page} failed after {yielded} deals, run incomplete")
+            page += 1
+            more = len(deals) >= DEAL_PAGE_SIZE and (not max_pages or page < max_pages)
+            if max_deals:
+                more = more and yielded + len(deals) < max_deals
+            pending = executor.submit(fetch_deals_for_deals, page) if more else None
+            for deal in deals:
+                if max_deals and yielded >= max_deals:
+                    break
+                yielded += 1
+                yield deal
+    logging.info("Deal pages exhausted: %s page(s), %s deals", page, yielded)
+# Deal pages ends
+
 # Deal Found starts
+# 2026-10-17: Deal timestamps are returned as raw Keepa minutes (MISSING when invalid); column_formats formats them.
 def deal_found(deal):
     ts = deal.get('creationDate', 0)
-    logging.debug(f"Deal found - raw ts={ts}")
-    dt = (KEEPA_EPOCH + timedelta(minutes=ts)) if ts > 100000 else None
-    return {'Deal found': TORONTO_TZ.localize(dt).strftime('%Y-%m-%d %H:%M:%S') if dt else '-'}
+    logging.debug("Deal found - raw ts=%s", ts)
+    return {'Deal found': ts if ts is not None and ts > MIN_VALID_MINUTES else MISSING}
 # Deal Found ends
 
 # Last update starts
-@retry(stop_max_attempt_number=3, wait_fixed=5000)
+# 2026-10-18: Placeholder check uses keepa_time.MIN_VALID_MINUTES; a missing value is routine, logged at debug.
 def last_update(deal):
     ts = deal.get('lastUpdate', 0)
-    logging.debug(f"last update - raw ts={ts}")
-    if ts <= 100000:
-        logging.error(f"No valid lastUpdate for deal: {deal}")
-        return {'last update': '-'}
-    try:
-        dt = KEEPA_EPOCH + timedelta(minutes=ts)
-        formatted = TORONTO_TZ.localize(dt).strftime('%Y-%m-%d %H:%M:%S')
-        logging.debug(f"last update result: {formatted}")
-        return {'last update': formatted}
-    except Exception as e:
-        logging.error(f"last_update failed: {str(e)}")
-        return {'last update': '-'}
+    logging.debug("last update - raw ts=%s", ts)
+    if ts <= MIN_VALID_MINUTES:
+        logging.debug("No valid lastUpdate for ASIN %s", deal.get('asin', '-'))
+        return {'last update': MISSING}
+    return {'last update': ts}
 # Last update ends
 
 # Last price change starts
-@retry(stop_max_attempt_number=3, wait_fixed=5000)
+# 2026-10-18: Same placeholder check and debug logging as last_update.
 def last_price_change(deal):
     ts = deal.get('currentSince', [-1] * 20)[11]
-    logging.debug(f"last price change - raw ts={ts}")
-    if ts <= 100000:
-        logging.error(f"No valid currentSince[11] for deal: {deal}")
-        return {'last price change': '-'}
-    try:
-        dt = KEEPA_EPOCH + timedelta(minutes=ts)
-        formatted = TORONTO_TZ.localize(dt).strftime('%Y-%m-%d %H:%M:%S')
-        logging.debug(f"last price change result: {formatted}")
-        return {'last price change': formatted}
-    except Exception as e:
-        logging.error(f"last_price_change failed: {str(e)}")
-        return {'last price change': '-'}
+    logging.debug("last price change - raw ts=%s", ts)
+    if ts <= MIN_VALID_MINUTES:
+        logging.debug("No valid currentSince[11] for ASIN %s", deal.get('asin', '-'))
+        return {'last price change': MISSING}
+    return {'last price change': ts}
 # Last price change ends
 
 #### END OF FILE ####
\ No newline at end of file
@@ -1,77 +1,140 @@
 # stable_products.py
 # Unchanged imports and globals
-import requests
 import logging
 from retrying import retry
-from datetime import datetime, timedelta
-from pytz import timezone
-from stable_deals import validate_asin
-import json
-# Removed unused import: from keepa import Keepa
+from stable_deals import validate_asin, MISSING
+from token_scheduler import scheduler, estimate_product_cost
+from keepa_session import get_keepa_client
+from buy_box_fallback import buy_box_used_value
+from offer_index import offer_index
+from keepa_time import MIN_VALID_MINUTES
 
 # Fetch Product for Retry - starts
+# 2026-10-17: Uses the shared keepa client (it referenced Keepa before the import and called .get on the result list).
 @retry(stop_max_attempt_number=3, wait_fixed=2000)
 def fetch_product_for_retry(asin):
-    with open('config.json') as f:
-        config = json.load(f)
-    api = Keepa(config['api_key'])
-    product = api.query(asin, product_code_is_asin=True, stats=90, domain='US', history=True, offers=20)
-    if not product or not product[0]:
-        logging.error(f"fetch_product_for_retry failed: no product data for ASIN {asin}")
+    api = get_keepa_client()
+    scheduler.acquire(estimate_product_cost(1, offers=20))
+    products = api.query(asin, product_code_is_asin=True, stats=90, domain='US', history=True, offers=20, progress_bar=False)
+    scheduler.update_from_client(api)
+    if not products or not products[0]:
+        logging.error("fetch_product_for_retry failed: no product data for ASIN %s", asin)
         return {}
-    stats = product[0].get('stats', {})
-    stats_current = stats.get('current', [-1] * 20)
-    offers = product.get('offers', []) if product.get('offers') is not None else []
-    logging.debug(f"fetch_product_for_retry response for ASIN {asin}: stats_keys={list(stats.keys())}, stats_current={stats_current}, stats_raw={stats}, offers_count={len(offers)}")
-    return product[0]
+    product = products[0]
+    stats = product.get('stats') or {}
+    logging.debug("fetch_product_for_retry response for ASIN %s: stats_keys=%s, stats_current=%s, offers_count=%s", asin, list(stats.keys()), stats.get('current', [-1] * 20), len(product.get('offers') or []))
+    return product
 # Fetch Product for Retry - ends
 
-# Constants
-KEEPA_EPOCH = datetime(2011, 1, 1)
-TORONTO_TZ = timezone('America/Toronto')
-
 # Shared globals
-API_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/90.0.4430.212'}
+# API_HEADERS now lives in keepa_session.py and is applied by the shared session
 
 # Global stuff starts
-def get_stat_value(stats, key, index, divisor=1, is_price=False):
+# 2026-10-17: Numeric extractors return raw values in Keepa's units (prices in cents, ranks,
+# rating x10, Keepa minutes) or MISSING; column_formats renders them for the CSV in bulk.
+
+def get_stat_raw(stats, key, index):
     try:
         value = stats.get(key, [])
-        logging.debug(f"get_stat_value: key={key}, index={index}, stats[{key}]={value}")
+        logging.debug("get_stat_raw: key=%s, index=%s, stats[%s]=%s", key, index, key, value)
         if not value or len(value) <= index:
-            logging.warning(f"get_stat_value: No data for key={key}, index={index}, returning '-'")
-            return '-'
+            logging.warning("get_stat_raw: No data for key=%s, index=%s, returning MISSING", key, index)
+            return MISSING
         value = value[index]
-        logging.debug(f"get_stat_value: key={key}, index={index}, value={value}")
+        logging.debug("get_stat_raw: key=%s, index=%s, value=%s", key, index, value)
         if isinstance(value, list):
             value = value[1] if len(value) > 1 else -1
         if value == -1 or value is None:
-            return '-'
-        if is_price:
-            return f"${value / divisor:.2f}"
-        return f"{int(value / divisor):,}"
+            return MISSING
+        return value
     except (IndexError, TypeError, AttributeError) as e:
-        logging.error(f"get_stat_value failed: stats={stats}, key={key}, index={index}, error={str(e)}")
+        logging.error("get_stat_raw failed: stats=%s, key=%s, index=%s, error=%s", stats, key, index, e)
+        return MISSING
+
+def get_stat_value(stats, key, index, divisor=1, is_price=False):
+    # Display string version, for callers outside the extractor path
+    value = get_stat_raw(stats, key, index)
+    if value is MISSING:
         return '-'
+    return STAT_FORMATS['price' if is_price else 'count'](value, divisor)
 # Global stuff ends
 
+# Stat columns starts
+# Table-driven columns read straight from the stats object: (header, stats key, csv index, divisor, kind).
+# stat_columns fills all of them in one pass, so these headers need no hand-written function each.
+# Indices are Keepa csv types: 0 Amazon, 1 New, 2 Used, 3 Sales Rank, 4 List Price, 7 New FBM,
+# 10 New FBA, 11 New Offer Count, 12 Used Offer Count, 16 Rating, 17 Review Count, 18 Buy Box,
+# 19-22 Used like new/very good/good/acceptable, 32 Buy Box Used.
+STAT_FORMATS = {
+    'price': lambda value, divisor: f"${value / divisor:.2f}",
+    'count': lambda value, divisor: f"{int(value / divisor):,}",
+    'percent': lambda value, divisor: f"{value}%",
+    'rating': lambda value, divisor: f"{value / divisor:.1f}",
+}
+PRICE_WINDOWS = [
+    ('30 days avg.', 'avg30'),
+    ('90 days avg.', 'avg90'),
+    ('180 days avg.', 'avg180'),
+    ('365 days avg.', 'avg365'),
+    ('Lowest', 'min'),
+    ('Lowest 365 days', 'minInInterval'),  # stats=365, so the interval is the last 365 days
+    ('Highest', 'max'),
+    ('Highest 365 days', 'maxInInterval'),
+]
+PRICE_SERIES = [
+    ('Buy Box', 18),
+    ('Amazon', 0),
+    ('New', 1),
+    ('New, 3rd Party FBA', 10),
+    ('New, 3rd Party FBM', 7),
+    ('Buy Box Used', 32),
+    ('Used', 2),
+    ('Used, like new', 19),
+    ('Used, very good', 20),
+    ('Used, good', 21),
+    ('Used, acceptable', 22),
+    ('List Price', 4),
+]
+STAT_SPECS = (
+    [(f"{name} - {suffix}", key, index, 100, 'price') for name, index in PRICE_SERIES for suffix, key in PRICE_WINDOWS]
+    + [(f"{name} - 90 days OOS", 'outOfStockPercentage90', index, 1, 'percent') for name, index in PRICE_SERIES]
+    + [(f"Sales Rank - {suffix}", key, 3, 1, 'count') for suffix, key in PRICE_WINDOWS[4:]]
+    + [(f"{name} - Current", 'current', index, 1, 'count') for name, index in [('New Offer Count', 11), ('Used Offer Count', 12)]]
+    + [(f"{name} - {suffix}", key, index, 1, 'count') for name, index in [('New Offer Count', 11), ('Used Offer Count', 12)] for suffix, key in PRICE_WINDOWS[:4]]
+    + [
+        ('Reviews - Rating', 'current', 16, 10, 'rating'),
+        ('Reviews - Review Count', 'current', 17, 1, 'count'),
+    ]
+)
+
+def stat_columns(product):
+    stats = product.get('stats') or {}
+    row = {}
+    for header, key, index, divisor, kind in STAT_SPECS:
+        values = stats.get(key)
+        value = values[index] if values and len(values) > index else None
+        if isinstance(value, list):
+            value = value[1] if len(value) > 1 else None  # min/max entries are [keepaTime, value]
+        row[header] = MISSING if value is None or value < 0 else value
+    return row
+# Stat columns ends
+
 # Percent Down 90 starts
 def percent_down_90(product):
-    logging.debug(f"percent_down_90 input: {product.get('asin', '-')}")
+    logging.debug("percent_down_90 input: %s", product.get('asin', '-'))
     stats_90 = product.get('stats', {})
     avg = stats_90.get('avg90', [-1] * 20)[2]  # Used price
     curr = stats_90.get('current', [-1] * 20)[2]  # Used price
     if avg <= 0 or curr < 0 or avg is None or curr is None:
-        logging.error(f"No valid avg90 or current for ASIN {product.get('asin', '-')}: avg={avg}, curr={curr}")
-        return {'Percent Down 90': '-'}
+        logging.error("No valid avg90 or current for ASIN %s: avg=%s, curr=%s", product.get('asin', '-'), avg, curr)
+        return {'Percent Down 90': MISSING}
     try:
         value = ((avg - curr) / avg * 100)
-        percent = f"{value:.0f}%"
-        logging.debug(f"percent_down_90 result: {percent}")
-        return {'Percent Down 90': percent}
+        logging.debug("percent_down_90 result: %s", value)
+        return {'Percent Down 90': value}
     except Exception as e:
-        logging.error(f"percent_down_90 failed: {str(e)}")
-        return {'Percent Down 90': '-'}
+        logging.error("percent_down_90 failed: %s", e)
+        return {'Percent Down 90': MISSING}
 # Percent Down 90 ends
 
 # Avg. Price 90,
@@ -93,7 +156,7 @@ def percent_down_90(product):
 def amz_link(product):
     asin = product.get('asin', '-')
     result = {'AMZ link': f"https://www.amazon.com/dp/{asin}" if asin != '-' else '-'}
-    logging.debug(f"amz_link result for ASIN {asin}: {result}")
+    logging.debug("amz_link result for ASIN %s: %s", asin, result)
     return result
 # AMZ link ends
 
@@ -101,7 +164,7 @@ def amz_link(product):
 def keepa_link(product):
     asin = product.get('asin', '-')
     result = {'Keepa Link': f"https://keepa.com/#!product/1-{asin}" if asin != '-' else '-'}
-    logging.debug(f"keepa_link result for ASIN {asin}: {result}")
+    logging.debug("keepa_link result for ASIN %s: %s", asin, result)
     return result
 # Keepa Link ends
 
@@ -110,8 +173,8 @@ def get_title(product):
     title = product.get('title', '-')
     asin = product.get('asin', 'unknown')
     if title == '-':
-        logging.warning(f"get_title: No title found for ASIN {asin}")
-    logging.debug(f"get_title result for ASIN {asin}: {title[:50]}")
+        logging.warning("get_title: No title found for ASIN %s", asin)
+    logging.debug("get_title result for ASIN %s: %s", asin, title[:50])
     return {'Title': title}
 # Title ends
 
@@ -124,28 +187,22 @@ def get_title(product):
 # Referral Fee %
 
 # Tracking since starts
+# 2026-10-18: Placeholder check uses keepa_time.MIN_VALID_MINUTES.
 @retry(stop_max_attempt_number=3, wait_fixed=5000)
 def tracking_since(product):
     ts = product.get('trackingSince', 0)
-    logging.debug(f"Tracking since - raw ts={ts}")
-    if ts <= 100000:
-        logging.error(f"No valid trackingSince for ASIN {product.get('asin', 'unknown')}")
-        return {'Tracking since': '-'}
-    try:
-        dt = KEEPA_EPOCH + timedelta(minutes=ts)
-        formatted = TORONTO_TZ.localize(dt).strftime('%Y-%m-%d')
-        logging.debug(f"Tracking since result for ASIN {product.get('asin', 'unknown')}: {formatted}")
-        return {'Tracking since': formatted}
-    except Exception as e:
-        logging.error(f"tracking_since failed: {str(e)}")
-        return {'Tracking since': '-'}
+    logging.debug("Tracking since - raw ts=%s", ts)
+    if ts <= MIN_VALID_MINUTES:
+        logging.error("No valid trackingSince for ASIN %s", product.get('asin', 'unknown'))
+        return {'Tracking since': MISSING}
+    return {'Tracking since': ts}
 # Tracking since ends
 
 # Categories - Root starts
 def categories_root(product):
     category_tree = product.get('categoryTree', [])
     result = {'Categories - Root': category_tree[0]['name'] if category_tree else '-'}
-    logging.debug(f"categories_root result for ASIN {product.get('asin', 'unknown')}: {result}")
+    logging.debug("categories_root result for ASIN %s: %s", product.get('asin', 'unknown'), result)
     return result
 # Categories - Root ends
 
@@ -153,7 +210,7 @@ def categories_root(product):
 def categories_sub(product):
     category_tree = product.get('categoryTree', [])
     result = {'Categories - Sub': ', '.join(cat['name'] for cat in category_tree[2:]) if len(category_tree) > 2 else '-'}
-    logging.debug(f"categories_sub result for ASIN {product.get('asin', 'unknown')}: {result}")
+    logging.debug("categories_sub result for ASIN %s: %s", product.get('asin', 'unknown'), result)
     return result
 # Categories - Sub ends
 
@@ -161,15 +218,15 @@ def categories_sub(product):
 def categories_tree(product):
     category_tree = product.get('categoryTree', [])
     result = {'Categories - Tree': ' > '.join(cat['name'] for cat in category_tree) if category_tree else '-'}
-    logging.debug(f"categories_tree result for ASIN {product.get('asin', 'unknown')}: {result}")
+    logging.debug("categories_tree result for ASIN %s: %s", product.get('asin', 'unknown'), result)
     return result
 # Categories - Tree ends
 
 # ASIN starts
 def get_asin(product):
     asin = product.get('asin', '-')
-    result = {'ASIN': f'="{asin}"' if asin != '-' else '-'}
-    logging.debug(f"get_asin result for ASIN {asin}: {result}")
+    result = {'ASIN': asin if asin != '-' else MISSING}
+    logging.debug("get_asin result for ASIN %s: %s", asin, result)
     return result
 # ASIN ends
 
@@ -180,7 +237,7 @@ def get_asin(product):
 def manufacturer(product):
     manufacturer_value = product.get('manufacturer', '-')
     result = {'Manufacturer': manufacturer_value}
-    logging.debug(f"manufacturer result for ASIN {product.get('asin', 'unknown')}: {result}")
+    logging.debug("manufacturer result for ASIN %s: %s", product.get('asin', 'unknown'), result)
     return result
 # Manufacturer ends
 
@@ -193,7 +250,7 @@ def manufacturer(product):
 def author(product):
     author_value = product.get('author', '-')
     result = {'Author': author_value}
-    logging.debug(f"author result for ASIN {product.get('asin', 'unknown')}: {result}")
+    logging.debug("author result for ASIN %s: %s", product.get('asin', 'unknown'), result)
     return result
 # Author ends
 
@@ -203,7 +260,7 @@ def author(product):
 def binding(product):
     binding_value = product.get('binding', '-')
     result = {'Binding': binding_value}
-    logging.debug(f"binding result for ASIN {product.get('asin', 'unknown')}: {result}")
+    logging.debug("binding result for ASIN %s: %s", product.get('asin', 'unknown'), result)
     return result
 # Binding ends
 
@@ -220,7 +277,7 @@ def binding(product):
 #        return {'Package - Quantity': '-'}
 #    url = f"https://api.keepa.com/product?key={api_key}&domain=1&asin={asin}"
 #    try:
-#        response = requests.get(url, headers=API_HEADERS, timeout=30)
+#        response = get_session().get(url, timeout=30)
 #        logging.debug(f"package_quantity response status for ASIN {asin}: {response.status_code}")
 #        if response.status_code != 200:
 #            logging.error(f"package_quantity request failed for ASIN {asin}: {response.status_code}")
@@ -241,28 +298,28 @@ def binding(product):
 # Package Weight starts
 def package_weight(product):
     weight = product.get('packageWeight', -1)
-    result = {'Package Weight': f"{weight / 1000:.2f} kg" if weight != -1 else '-'}
+    result = {'Package Weight': weight if weight != -1 else MISSING}
     return result
 # Package Weight ends
 
 # Package Height starts
 def package_height(product):
     height = product.get('packageHeight', -1)
-    result = {'Package Height': f"{height / 10:.1f} cm" if height != -1 else '-'}
+    result = {'Package Height': height if height != -1 else MISSING}
     return result
 # Package Height ends
 
 # Package Length starts
 def package_length(product):
     length = product.get('packageLength', -1)
-    result = {'Package Length': f"{length / 10:.1f} cm" if length != -1 else '-'}
+    result = {'Package Length': length if length != -1 else MISSING}
     return result
 # Package Length ends
 
 # Package Width starts
 def package_width(product):
     width = product.get('packageWidth', -1)
-    result = {'Package Width': f"{width / 10:.1f} cm" if width != -1 else '-'}
+    result = {'Package Width': width if width != -1 else MISSING}
     return result
 # Package Width ends
 
@@ -270,18 +327,11 @@ def package_width(product):
 def listed_since(product):
     ts = product.get('listedSince', 0)
     asin = product.get('asin', 'unknown')
-    logging.debug(f"Listed since - raw ts={ts} for ASIN {asin}")
+    logging.debug("Listed since - raw ts=%s for ASIN %s", ts, asin)
     if ts <= 0:
-        logging.info(f"No valid listedSince (ts={ts}) for ASIN {asin}")
-        return {'Listed since': '-'}
-    try:
-        dt = KEEPA_EPOCH + timedelta(minutes=ts)
-        formatted = TORONTO_TZ.localize(dt).strftime('%Y-%m-%d')
-        logging.debug(f"Listed since result for ASIN {asin}: {formatted}")
-        return {'Listed since': formatted}
-    except Exception as e:
-        logging.error(f"listed_since failed for ASIN {asin}: {str(e)}")
-        return {'Listed since': '-'}
+        logging.info("No valid listedSince (ts=%s) for ASIN %s", ts, asin)
+        return {'Listed since': MISSING}
+    return {'Listed since': ts}
 # Listed since ends
 
 # Edition
@@ -291,14 +341,14 @@ def listed_since(product):
 # Sales Rank - Current starts
 def sales_rank_current(product):
     stats = product.get('stats', {})
-    result = {'Sales Rank - Current': get_stat_value(stats, 'current', 3, is_price=False)}
+    result = {'Sales Rank - Current': get_stat_raw(stats, 'current', 3)}
     return result
 # Sales Rank - Current ends
 
 # Sales Rank - 30 days avg starts
 def sales_rank_30_days_avg(product):
     stats = product.get('stats', {})
-    result = {'Sales Rank - 30 days avg.': get_stat_value(stats, 'avg30', 3, is_price=False)}
+    result = {'Sales Rank - 30 days avg.': get_stat_raw(stats, 'avg30', 3)}
     return result
 # Sales Rank - 30 days avg ends
 
@@ -307,22 +357,22 @@ def sales_rank_30_days_avg(product):
 # Sales Rank - 90 days avg starts
 def sales_rank_90_days_avg(product):
     stats = product.get('stats', {})
-    result = {'Sales Rank - 90 days avg.': get_stat_value(stats, 'avg90', 3, is_price=False)}
-    logging.debug(f"Sales Rank - 90 days avg. for ASIN {product.get('asin', 'unknown')}: {result}")
+    result = {'Sales Rank - 90 days avg.': get_stat_raw(stats, 'avg90', 3)}
+    logging.debug("Sales Rank - 90 days avg. for ASIN %s: %s", product.get('asin', 'unknown'), result)
     return result
 # Sales Rank - 90 days avg ends
 
 # Sales Rank - 180 days avg starts
 def sales_rank_180_days_avg(product):
     stats = product.get('stats', {})
-    result = {'Sales Rank - 180 days avg.': get_stat_value(stats, 'avg180', 3, is_price=False)}
+    result = {'Sales Rank - 180 days avg.': get_stat_raw(stats, 'avg180', 3)}
     return result
 # Sales Rank - 180 days avg ends
 
 # Sales Rank - 365 days avg starts
 def sales_rank_365_days_avg(product):
     stats = product.get('stats', {})
-    result = {'Sales Rank - 365 days avg.': get_stat_value(stats, 'avg365', 3, is_price=False)}
+    result = {'Sales Rank - 365 days avg.': get_stat_raw(stats, 'avg365', 3)}
     return result
 # Sales Rank - 365 days avg ends
 
@@ -336,17 +386,11 @@ def sales_rank_drops_last_30_days(product):
     asin = product.get('asin', 'unknown')
     stats = product.get('stats', {})
     value = stats.get('salesRankDrops30', -1)
-    logging.debug(f"Sales Rank - Drops last 30 days - raw value={value} for ASIN {asin}")
+    logging.debug("Sales Rank - Drops last 30 days - raw value=%s for ASIN %s", value, asin)
     if value < 0:
-        logging.info(f"No valid Sales Rank - Drops last 30 days (value={value}) for ASIN {asin}")
-        return {'Sales Rank - Drops last 30 days': '-'}
-    try:
-        formatted = str(value)
-        logging.debug(f"Sales Rank - Drops last 30 days result for ASIN {asin}: {formatted}")
-        return {'Sales Rank - Drops last 30 days': formatted}
-    except Exception as e:
-        logging.error(f"sales_rank_drops_last_30_days failed for ASIN {asin}: {str(e)}")
-        return {'Sales Rank - Drops last 30 days': '-'}
+        logging.info("No valid Sales Rank - Drops last 30 days (value=%s) for ASIN %s", value, asin)
+        return {'Sales Rank - Drops last 30 days': MISSING}
+    return {'Sales Rank - Drops last 30 days': value}
 # Sales Rank - Drops last 30 days ends
 
 # Sales Rank - Drops last 60 days
@@ -358,17 +402,11 @@ def sales_rank_drops_last_365_days(product):
     asin = product.get('asin', 'unknown')
     stats = product.get('stats', {})
     value = stats.get('salesRankDrops365', -1)
-    logging.debug(f"Sales Rank - Drops last 365 days - raw value={value} for ASIN {asin}")
+    logging.debug("Sales Rank - Drops last 365 days - raw value=%s for ASIN %s", value, asin)
     if value < 0:
-        logging.info(f"No valid Sales Rank - Drops last 365 days (value={value}) for ASIN {asin}")
-        return {'Sales Rank - Drops last 365 days': '-'}
-    try:
-        formatted = str(value)
-        logging.debug(f"Sales Rank - Drops last 365 days result for ASIN {asin}: {formatted}")
-        return {'Sales Rank - Drops last 365 days': formatted}
-    except Exception as e:
-        logging.error(f"sales_rank_drops_last_365_days failed for ASIN {asin}: {str(e)}")
-        return {'Sales Rank - Drops last 365 days': '-'}
+        logging.info("No valid Sales Rank - Drops last 365 days (value=%s) for ASIN %s", value, asin)
+        return {'Sales Rank - Drops last 365 days': MISSING}
+    return {'Sales Rank - Drops last 365 days': value}
 # Sales Rank - Drops last 365 days ends
 
 # Buy Box - Current starts - stopped working after a change to new 3rd party fbm current
@@ -378,17 +416,12 @@ def buy_box_current(product):
     stats = product.get('stats', {})
     current = stats.get('current', [-1] * 20)
     value = current[0] if len(current) > 0 else -1
-    logging.debug(f"Buy Box - Current - raw value={value}, current array={current}, stats_keys={list(stats.keys())} for ASIN {asin}")
+    logging.debug("Buy Box - Current - raw value=%s, current array=%s, stats_keys=%s for ASIN %s", value, current, list(stats.keys()), asin)
     if value <= 0 or value == -1:
-        logging.warning(f"No valid Buy Box - Current (value={value}, current_length={len(current)}) for ASIN {asin}")
-        return {'Buy Box - Current': '-'}
-    try:
-        formatted = f"${value / 100:.2f}"
-        logging.debug(f"Buy Box - Current result for ASIN {asin}: {formatted}")
-        return {'Buy Box - Current': formatted}
-    except Exception as e:
-        logging.error(f"buy_box_current failed for ASIN {asin}: {str(e)}")
-        return {'Buy Box - Current': '-'}
+        logging.warning("No valid Buy Box - Current (value=%s, current_length=%s) for ASIN %s", value, len(current), asin)
+        return {'Buy Box - Current': MISSING}
+    logging.debug("Buy Box - Current result for ASIN %s: %s", asin, value)
+    return {'Buy Box - Current': value}
 # Buy Box - Current ends
 
 # Buy Box - 30 days avg.
@@ -442,17 +475,12 @@ def new_current(product):
     stats = product.get('stats', {})
     current = stats.get('current', [-1] * 20)
     value = current[1] if len(current) > 1 else -1
-    logging.debug(f"New - Current - raw value={value}, current array={current}, stats_keys={list(stats.keys())} for ASIN {asin}")
+    logging.debug("New - Current - raw value=%s, current array=%s, stats_keys=%s for ASIN %s", value, current, list(stats.keys()), asin)
     if value <= 0 or value == -1:
-        logging.warning(f"No valid New - Current (value={value}, current_length={len(current)}) for ASIN {asin}")
-        return {'New - Current': '-'}
-    try:
-        formatted = f"${value / 100:.2f}"
-        logging.debug(f"New - Current result for ASIN {asin}: {formatted}")
-        return {'New - Current': formatted}
-    except Exception as e:
-        logging.error(f"new_current failed for ASIN {asin}: {str(e)}")
-        return {'New - Current': '-'}
+        logging.warning("No valid New - Current (value=%s, current_length=%s) for ASIN %s", value, len(current), asin)
+        return {'New - Current': MISSING}
+    logging.debug("New - Current result for ASIN %s: %s", asin, value)
+    return {'New - Current': value}
 # New - Current ends
 
 # New - 30 days avg.
@@ -469,17 +497,17 @@ def new_current(product):
 
 # New, 3rd Party FBA - Current starts
 # 2025-05-20: Impossible to verify New, 3rd Party FBA - Current, as CSV and Keepa showed all '-' for 5 ASINs (commit 7ef4629e). Update uses offers array for reliability.
+# 2026-10-18: Reads the product's offer index (offer_index.py) instead of scanning the offers itself.
 def new_3rd_party_fba_current(product):
     asin = product.get('asin', 'unknown')
     stats = product.get('stats', {})
-    offers = product.get('offers', [])
-    current_price = get_stat_value(stats, 'current', 11, divisor=100, is_price=True)
-    fba_prices = [o.get('price', -1) / 100 for o in offers if o.get('condition') == 'New' and o.get('isFBA', False)]
-    if not fba_prices or current_price == '-' or not any(abs(float(current_price[1:]) - p) < 0.01 for p in fba_prices):
-        logging.warning(f"No valid FBA price for ASIN {asin}: stats={current_price}, offers={fba_prices}")
-        return {'New, 3rd Party FBA - Current': '-'}
+    current_price = get_stat_raw(stats, 'current', 11)
+    fba_prices = [price / 100 for price in offer_index(product).bucket('New', 'FBA').prices]
+    if not fba_prices or current_price is MISSING or not any(abs(float(f"{current_price / 100:.2f}") - p) < 0.01 for p in fba_prices):
+        logging.warning("No valid FBA price for ASIN %s: stats=%s, offers=%s", asin, current_price, fba_prices)
+        return {'New, 3rd Party FBA - Current': MISSING}
     result = {'New, 3rd Party FBA - Current': current_price}
-    logging.debug(f"new_3rd_party_fba_current result for ASIN {asin}: {result}")
+    logging.debug("new_3rd_party_fba_current result for ASIN %s: %s", asin, result)
     return result
 # New, 3rd Party FBA - Current ends
 
@@ -502,18 +530,17 @@ def new_3rd_party_fba_current(product):
 # 2025-05-22: Enhanced logging for Python client, offers=100 (commit 69d2801d).
 # 2025-05-22: Added Python client fallback for offers (commit e1f6f52e).
 # 2025-05-22: Removed Python client, use HTTP fetch_product offers=100.
+# 2026-10-18: Lowest price comes from the product's offer index (offer_index.py).
 def new_3rd_party_fbm_current(product):
     asin = product.get('asin', 'unknown')
-    offers = product.get('offers', [])
-    logging.debug(f"HTTP FBM offers for ASIN {asin}: count={len(offers)}, offers={offers}")
-    fbm_prices = [o.get('price') / 100 for o in offers if o.get('condition') == 'New' and o.get('isFBA', False) is False and o.get('price', -1) > 0]
-    if not fbm_prices:
-        logging.warning(f"No valid HTTP FBM offers for ASIN {asin}: fbm_prices={fbm_prices}, raw_offers={offers}")
-        return {'New, 3rd Party FBM - Current': '-'}
-    lowest_fbm = min(fbm_prices)
-    formatted = f"${lowest_fbm:.2f}"
-    logging.debug(f"New, 3rd Party FBM - Current - lowest_fbm={lowest_fbm}, result={formatted} for ASIN {asin}")
-    return {'New, 3rd Party FBM - Current': formatted}
+    index = offer_index(product)
+    logging.debug("HTTP FBM offers for ASIN %s: count=%s, offers=%s", asin, len(index.offers), index.offers)
+    lowest_fbm = index.bucket('New', 'FBM').min_price
+    if lowest_fbm is MISSING:
+        logging.warning("No valid HTTP FBM offers for ASIN %s: fbm_prices=%s, raw_offers=%s", asin, [], index.offers)
+        return {'New, 3rd Party FBM - Current': MISSING}
+    logging.debug("New, 3rd Party FBM - Current - lowest_fbm=%s for ASIN %s", lowest_fbm, asin)
+    return {'New, 3rd Party FBM - Current': lowest_fbm}
 # New, 3rd Party FBM - Current ends
 
 
@@ -563,37 +590,16 @@ def new_3rd_party_fbm_current(product):
 # 2025-05-22: Enhanced logging for stats.current[9], offers=100 (commit a03ceb87).
 # 2025-05-22: Enhanced logging for Python client, stats.current[9], offers=100 (commit 69d2801d).
 # 2025-05-22: Added Python client fallback for stats.current[9] (commit e1f6f52e).
-from keepa import Keepa
+# 2026-10-17: The Python client fallback is deferred: build_rows passes every batch to
+# buy_box_fallback.patch_rows, which re-queries the empty cells together through one client.
 def buy_box_used_current(product):
     asin = product.get('asin', 'unknown')
-    stats = product.get('stats', {})
-    current = stats.get('current', [-1] * 20)
-    value = current[9] if len(current) > 9 else -1
-    logging.debug(f"Buy Box Used - Current HTTP - raw value={value}, current array={current}, stats_keys={list(stats.keys())}, stats_current={stats.get('current', [])}, offers_count={len(product.get('offers', []))} for ASIN {asin}")
-    if value <= 0 or value == -1:
-        logging.warning(f"No valid HTTP Buy Box Used - Current (value={value}, current_length={len(current)}) for ASIN {asin}")
-        try:
-            with open('config.json') as f:
-                config = json.load(f)
-            api = Keepa(config['api_key'])
-            py_product = api.query(asin, product_code_is_asin=True, stats=90, domain='US', history=True, offers=100)
-            py_stats = py_product[0].get('stats', {}) if py_product else {}
-            py_current = py_stats.get('current', [-1] * 20)
-            value = py_current[9] if len(py_current) > 9 else -1
-            logging.debug(f"Buy Box Used - Current Python - raw value={value}, current array={py_current}, stats_keys={list(py_stats.keys())} for ASIN {asin}")
-            if value <= 0 or value == -1:
-                logging.warning(f"No valid Python Buy Box Used - Current (value={value}, current_length={len(py_current)}) for ASIN {asin}")
-                return {'Buy Box Used - Current': '-'}
-        except Exception as e:
-            logging.error(f"Python fetch failed for ASIN {asin}: {str(e)}")
-            return {'Buy Box Used - Current': '-'}
-    try:
-        formatted = f"${value / 100:.2f}"
-        logging.debug(f"Buy Box Used - Current result for ASIN {asin}: {formatted}")
-        return {'Buy Box Used - Current': formatted}
-    except Exception as e:
-        logging.error(f"buy_box_used_current failed for ASIN {asin}: {str(e)}")
-        return {'Buy Box Used - Current': '-'}
+    value = buy_box_used_value(product)
+    if value is MISSING:
+        current = (product.get('stats') or {}).get('current') or []
+        logging.warning("No valid HTTP Buy Box Used - Current (current_length=%s) for ASIN %s, left for the client fallback", len(current), asin)
+    logging.debug("Buy Box Used - Current result for ASIN %s: %s", asin, value)
+    return {'Buy Box Used - Current': value}
 # Buy Box Used - Current ends
 
 # Buy Box Used - 30 days avg.
@@ -611,7 +617,7 @@ def buy_box_used_current(product):
 # Used - Current starts
 def used_current(product):
     stats = product.get('stats', {})
-    result = {'Used - Current': get_stat_value(stats, 'current', 2, divisor=100, is_price=True)}
+    result = {'Used - Current': get_stat_raw(stats, 'current', 2)}
     return result
 # Used - Current ends
 
@@ -631,9 +637,9 @@ def used_current(product):
 def used_like_new(product):
     stats = product.get('stats', {})
     asin = product.get('asin', 'unknown')
-    current_price = get_stat_value(stats, 'current', 4, divisor=100, is_price=True)
+    current_price = get_stat_raw(stats, 'current', 4)
     result = {'Used, like new - Current': current_price}
-    logging.debug(f"used_like_new for ASIN {asin}: stats.current={stats.get('current', [])}, current_price={current_price}")
+    logging.debug("used_like_new for ASIN %s: stats.current=%s, current_price=%s", asin, stats.get('current', []), current_price)
     return result
 # Used, like new - Current ends
 
@@ -654,9 +660,9 @@ def used_very_good(product):
     stats = product.get('stats', {})
     asin = product.get('asin', 'unknown')
     result = {
-        'Used, very good - Current': get_stat_value(stats, 'current', 5, divisor=100, is_price=True)
+        'Used, very good - Current': get_stat_raw(stats, 'current', 5)
     }
-    logging.debug(f"used_very_good result for ASIN {asin}: {result}")
+    logging.debug("used_very_good result for ASIN %s: %s", asin, result)
     return result
 # Used, very good - Current ends
 
@@ -677,9 +683,9 @@ def used_good(product):
     stats = product.get('stats', {})
     asin = product.get('asin', 'unknown')
     result = {
-        'Used, good - Current': get_stat_value(stats, 'current', 6, divisor=100, is_price=True)
+        'Used, good - Current': get_stat_raw(stats, 'current', 6)
     }
-    logging.debug(f"used_good result for ASIN {asin}: {result}")
+    logging.debug("used_good result for ASIN %s: %s", asin, result)
     return result
 # Used, good - Current ends
 
@@ -700,9 +706,9 @@ def used_acceptable(product):
     stats = product.get('stats', {})
     asin = product.get('asin', 'unknown')
     result = {
-        'Used, acceptable - Current': get_stat_value(stats, 'current', 7, divisor=100, is_price=True)
+        'Used, acceptable - Current': get_stat_raw(stats, 'current', 7)
     }
-    logging.debug(f"used_acceptable result for ASIN {asin}: {result}")
+    logging.debug("used_acceptable result for ASIN %s: %s", asin, result)
     return result
 # Used, acceptable - Current ends
 
@@ -725,17 +731,12 @@ def list_price(product):
     asin = product.get('asin', 'unknown')
     current = stats.get('current', [-1] * 20)
     value = current[8] if len(current) > 8 else -1
-    logging.debug(f"List Price - Current - raw value={value}, current array={current}, stats_keys={list(stats.keys())}, stats_raw={stats} for ASIN {asin}")
+    logging.debug("List Price - Current - raw value=%s, current array=%s, stats_keys=%s, stats_raw=%s for ASIN %s", value, current, list(stats.keys()), stats, asin)
     if value <= 0 or value == -1:
-        logging.warning(f"No valid List Price - Current (value={value}, current_length={len(current)}) for ASIN {asin}")
-        return {'List Price - Current': '-'}
-    try:
-        formatted = f"${value / 100:.2f}"
-        logging.debug(f"List Price - Current result for ASIN {asin}: {formatted}")
-        return {'List Price - Current': formatted}
-    except Exception as e:
-        logging.error(f"list_price failed for ASIN {asin}: {str(e)}")
-        return {'List Price - Current': '-'}
+        logging.warning("No valid List Price - Current (value=%s, current_length=%s) for ASIN %s", value, len(current), asin)
+        return {'List Price - Current': MISSING}
+    logging.debug("List Price - Current result for ASIN %s: %s", asin, value)
+    return {'List Price - Current': value}
 # List Price - Current ends
 
 # List Price - 30 days avg.,
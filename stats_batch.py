@@ -0,0 +1,106 @@
+# stats_batch.py
+# Batch mode for stats-derived columns: stacks current/avg30/avg90/avg180/avg365 (and the other
+# STAT_SPECS keys) for a whole product batch into 2-D int arrays padded with -1, then computes
+# every stats column with array operations instead of one get_stat_value call per cell.
+# Output is raw values (MISSING for empty cells), the same as the per-product functions it
+# replaces (see BATCH_FUNCS); column_formats renders them for the CSV.
+import numpy as np
+from stable_deals import MISSING as MISSING_VALUE, deal_found, last_update, last_price_change
+from stable_products import (
+    STAT_SPECS, stat_columns, percent_down_90,
+    sales_rank_current, sales_rank_30_days_avg, sales_rank_90_days_avg, sales_rank_180_days_avg, sales_rank_365_days_avg,
+    buy_box_current, new_current, used_current, used_like_new, used_very_good, used_good, used_acceptable, list_price,
+    tracking_since, listed_since,
+)
+
+MISSING = -1
+
+# Hand-written single-cell columns: (function, header, stats key, index, divisor, kind, missing rule).
+# 'eq' mirrors get_stat_value (only -1 is missing); 'nonpos' mirrors the functions that treat <= 0 as missing.
+LEGACY_SPECS = [
+    (sales_rank_current, 'Sales Rank - Current', 'current', 3, 1, 'count', 'eq'),
+    (sales_rank_30_days_avg, 'Sales Rank - 30 days avg.', 'avg30', 3, 1, 'count', 'eq'),
+    (sales_rank_90_days_avg, 'Sales Rank - 90 days avg.', 'avg90', 3, 1, 'count', 'eq'),
+    (sales_rank_180_days_avg, 'Sales Rank - 180 days avg.', 'avg180', 3, 1, 'count', 'eq'),
+    (sales_rank_365_days_avg, 'Sales Rank - 365 days avg.', 'avg365', 3, 1, 'count', 'eq'),
+    (buy_box_current, 'Buy Box - Current', 'current', 0, 100, 'price', 'nonpos'),
+    (new_current, 'New - Current', 'current', 1, 100, 'price', 'nonpos'),
+    (used_current, 'Used - Current', 'current', 2, 100, 'price', 'eq'),
+    (used_like_new, 'Used, like new - Current', 'current', 4, 100, 'price', 'eq'),
+    (used_very_good, 'Used, very good - Current', 'current', 5, 100, 'price', 'eq'),
+    (used_good, 'Used, good - Current', 'current', 6, 100, 'price', 'eq'),
+    (used_acceptable, 'Used, acceptable - Current', 'current', 7, 100, 'price', 'eq'),
+    (list_price, 'List Price - Current', 'current', 8, 100, 'price', 'nonpos'),
+]
+
+def _current_since_11(deal):
+    current_since = deal.get('currentSince') or []
+    return current_since[11] if len(current_since) > 11 else -1
+
+# Timestamp columns: (function, header, source, Keepa-minute getter, date only, minimum valid value)
+TIMESTAMP_SPECS = [
+    (deal_found, 'Deal found', 'deal', lambda deal: deal.get('creationDate', 0), False, 100000),
+    (last_update, 'last update', 'deal', lambda deal: deal.get('lastUpdate', 0), False, 100000),
+    (last_price_change, 'last price change', 'deal', _current_since_11, False, 100000),
+    (tracking_since, 'Tracking since', 'product', lambda product: product.get('trackingSince', 0), True, 100000),
+    (listed_since, 'Listed since', 'product', lambda product: product.get('listedSince', 0), True, 0),
+]
+# Extractors covered by batch_stat_columns / batch_timestamp_columns; the per-product plan skips these in batch mode
+BATCH_FUNCS = (stat_columns, percent_down_90) + tuple(spec[0] for spec in LEGACY_SPECS) + tuple(spec[0] for spec in TIMESTAMP_SPECS)
+
+def _value(entry):
+    # min/max entries are [keepaTime, value]; missing entries may be None
+    if isinstance(entry, list):
+        return entry[1] if len(entry) > 1 else MISSING
+    return MISSING if entry is None else entry
+
+def stack_stats(products, key):
+    series = [(product.get('stats') or {}).get(key) or [] for product in products]
+    width = max((len(values) for values in series), default=0)
+    stacked = np.full((len(products), width), MISSING, dtype=np.int64)
+    for i, values in enumerate(series):
+        try:
+            stacked[i, :len(values)] = values
+        except (TypeError, ValueError):
+            stacked[i, :len(values)] = [_value(entry) for entry in values]
+    return stacked
+
+def _raw(values, missing):
+    return [MISSING_VALUE if is_missing else value for value, is_missing in zip(values.tolist(), missing.tolist())]
+
+def batch_stat_columns(products):
+    count = len(products)
+    keys = {spec[1] for spec in STAT_SPECS} | {spec[2] for spec in LEGACY_SPECS} | {'avg90', 'current'}
+    arrays = {key: stack_stats(products, key) for key in keys}
+
+    def column(key, index):
+        stacked = arrays[key]
+        return stacked[:, index] if index < stacked.shape[1] else np.full(count, MISSING, dtype=np.int64)
+
+    columns = {}
+    for header, key, index, divisor, kind in STAT_SPECS:
+        values = column(key, index)
+        columns[header] = _raw(values, values < 0)
+    for _, header, key, index, divisor, kind, missing_rule in LEGACY_SPECS:
+        values = column(key, index)
+        missing = values <= 0 if missing_rule == 'nonpos' else values == MISSING
+        columns[header] = _raw(values, missing)
+
+    # Percent Down 90: used price, avg90 vs current
+    avg = column('avg90', 2)
+    curr = column('current', 2)
+    valid = (avg > 0) & (curr >= 0)
+    percent = (avg - curr) / np.where(valid, avg, 1) * 100
+    columns['Percent Down 90'] = [value if ok else MISSING_VALUE for value, ok in zip(percent.tolist(), valid.tolist())]
+
+    headers = list(columns)
+    return [dict(zip(headers, values)) for values in zip(*columns.values())]
+
+def batch_timestamp_columns(deals, products):
+    columns = {}
+    for _, header, source, getter, date_only, min_valid in TIMESTAMP_SPECS:
+        records = deals if source == 'deal' else products
+        minutes = [getter(record) or 0 for record in records]
+        columns[header] = [value if value > min_valid else MISSING_VALUE for value in minutes]
+    headers = list(columns)
+    return [dict(zip(headers, values)) for values in zip(*columns.values())]
@@ -0,0 +1,16 @@
+# Shared test setup: the modules read config.json and headers.json from the working directory at
+# import time, so tests run from a scratch directory with a test config (the real key is never used).
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_workdir = tempfile.mkdtemp(prefix='keepa_deals_tests_')
+with open(os.path.join(_workdir, 'config.json'), 'w') as f:
+    json.dump({'api_key': 'test-key', 'product_cache': False, 'deal_store': False, 'log_mode': 'production'}, f)
+shutil.copy(os.path.join(ROOT, 'headers.json'), _workdir)
+os.chdir(_workdir)
@@ -0,0 +1,68 @@
+from datetime import datetime
+import numpy as np
+import pytest
+import buy_box_fallback
+import product_cache
+from product_cache import ProductCache
+from stable_deals import MISSING
+
+@pytest.fixture(autouse=True)
+def no_token_waits(monkeypatch):
+    monkeypatch.setattr(buy_box_fallback.scheduler, 'acquire', lambda cost: None)
+
+class FakeClient:
+    # Answers like keepa.Keepa.query: raw product JSON plus the client's parsed 'data' and 'stats_parsed'
+    tokens_left = 1000
+    status = {'refillIn': 60000, 'refillRate': 20}
+
+    def __init__(self):
+        self.queried = []
+
+    def query(self, asins, **params):
+        self.queried.append(list(asins))
+        return [{'asin': asin, 'lastUpdate': 7000000, 'stats': {'current': [-1] * 9 + [1234]},
+                 'data': {'USED': np.array([12.34])}, 'stats_parsed': {'current': {'USED': datetime(2026, 1, 1)}}}
+                for asin in asins]
+
+def test_second_lookup_served_from_cache(monkeypatch, tmp_path):
+    client = FakeClient()
+    cache = ProductCache(str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(product_cache, 'cache', cache)
+    monkeypatch.setattr(buy_box_fallback, 'get_keepa_client', lambda: client)
+    first = buy_box_fallback.fetch_products(['B000000001'], {'B000000001': 7000000})
+    second = buy_box_fallback.fetch_products(['B000000001'], {'B000000001': 7000000})
+    assert client.queried == [['B000000001']]
+    assert cache.hits == 1
+    assert buy_box_fallback.buy_box_used_value(first['B000000001']) == 1234
+    assert buy_box_fallback.buy_box_used_value(second['B000000001']) == 1234
+    assert 'stats_parsed' not in second['B000000001'] and 'data' not in second['B000000001']
+    cache.close()
+
+def test_patch_rows_fills_missing_cells(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(product_cache, 'cache', None)
+    monkeypatch.setattr(buy_box_fallback, 'get_keepa_client', lambda: client)
+    pairs = [({'asin': 'B000000001'}, {'lastUpdate': 1}), ({'asin': 'B000000002'}, {'lastUpdate': 1})]
+    rows = [{'Buy Box Used - Current': MISSING}, {'Buy Box Used - Current': 500}]
+    assert buy_box_fallback.patch_rows(pairs, rows) == 1
+    assert rows == [{'Buy Box Used - Current': 1234}, {'Buy Box Used - Current': 500}]
+    assert client.queried == [['B000000001']]
+
+def test_failed_chunk_keeps_other_chunks(monkeypatch):
+    class FlakyClient(FakeClient):
+        def query(self, asins, **params):
+            if not self.queried:
+                self.queried.append(list(asins))
+                raise IndexError('list index out of range')
+            return super().query(asins, **params)
+
+    client = FlakyClient()
+    monkeypatch.setattr(product_cache, 'cache', None)
+    monkeypatch.setattr(buy_box_fallback, 'get_keepa_client', lambda: client)
+    asins = [f"B{i:09d}" for i in range(buy_box_fallback.MAX_ASINS + 20)]
+    pairs = [({'asin': asin}, {'lastUpdate': 1}) for asin in asins]
+    rows = [{'Buy Box Used - Current': MISSING} for _ in asins]
+    assert buy_box_fallback.patch_rows(pairs, rows) == 20
+    assert len(client.queried) == 2
+    assert all(row['Buy Box Used - Current'] is MISSING for row in rows[:buy_box_fallback.MAX_ASINS])
+    assert all(row['Buy Box Used - Current'] == 1234 for row in rows[buy_box_fallback.MAX_ASINS:])
@@ -0,0 +1,67 @@
+import pytest
+import stable_deals
+from stable_deals import DEAL_PAGE_SIZE, iter_deals
+
+def fake_pages(pages):
+    # pages: one deal list (or None for a failed fetch) per page number
+    def fetch(page):
+        return pages[page] if page < len(pages) else []
+    return fetch
+
+def deals(start, count):
+    return [{'asin': f"{i:010d}"} for i in range(start, start + count)]
+
+def test_short_page_ends_the_deals(monkeypatch):
+    monkeypatch.setattr(stable_deals, 'fetch_deals_for_deals', fake_pages([deals(0, DEAL_PAGE_SIZE), deals(DEAL_PAGE_SIZE, 3)]))
+    assert len(list(iter_deals())) == DEAL_PAGE_SIZE + 3
+
+def test_failed_second_page_raises(monkeypatch):
+    monkeypatch.setattr(stable_deals, 'fetch_deals_for_deals', fake_pages([deals(0, DEAL_PAGE_SIZE), None]))
+    seen = []
+    with pytest.raises(RuntimeError, match='Deal page 1 failed'):
+        for deal in iter_deals():
+            seen.append(deal)
+    assert len(seen) == DEAL_PAGE_SIZE
+
+def test_failed_first_page_raises(monkeypatch):
+    monkeypatch.setattr(stable_deals, 'fetch_deals_for_deals', fake_pages([None]))
+    with pytest.raises(RuntimeError):
+        list(iter_deals())
+
+def test_failed_page_http_error(monkeypatch):
+    class Response:
+        status_code = 500
+        text = 'error'
+        content = b'error'
+
+        def json(self):
+            return {}
+
+    class Session:
+        def get(self, url, timeout=None):
+            return Response()
+
+    monkeypatch.setattr(stable_deals, 'get_session', lambda: Session())
+    monkeypatch.setattr(stable_deals.scheduler, 'acquire', lambda cost: None)
+    assert stable_deals.fetch_deals_for_deals(1) is None
+
+def test_failed_page_keeps_previous_export(monkeypatch, tmp_path):
+    import Keepa_Deals
+    import deal_store
+    from deal_store import DealStore
+    monkeypatch.setattr(deal_store, 'STORE_BATCH_ROWS', 10)  # rows reach SQLite before the failing page
+    with open(Keepa_Deals.EXPORT_PATH, 'w') as f:
+        f.write('previous export\n')
+    store = DealStore(str(tmp_path / 'deal_store.sqlite'))
+    monkeypatch.setattr(stable_deals, 'fetch_deals_for_deals', fake_pages([deals(0, DEAL_PAGE_SIZE), None]))
+    monkeypatch.setattr(Keepa_Deals, 'fetch_products', lambda asins, **kw: {asin: {'asin': asin, 'stats': {'current': [-1] * 30}} for asin in asins})
+    monkeypatch.setattr(Keepa_Deals, 'open_store', lambda: store)
+    monkeypatch.setattr(Keepa_Deals, 'BUY_BOX_USED_FALLBACK', False)
+    with pytest.raises(SystemExit):
+        Keepa_Deals.main()
+    assert store.stored > 0
+    with open(Keepa_Deals.EXPORT_PATH) as f:
+        assert f.read() == 'previous export\n'
+    check = DealStore(str(tmp_path / 'deal_store.sqlite'))
+    assert check.query(latest=False) == [] and check.runs() == []
+    check.close()
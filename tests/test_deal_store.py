@@ -0,0 +1,61 @@
+import time
+import pytest
+from deal_store import DealStore
+
+DAY = 86400
+
+def deal(asin, rank, last_update=7000000, root_cat=283155):
+    return {'asin': asin, 'lastUpdate': last_update, 'rootCat': root_cat, 'current': [-1, -1, -1, rank]}
+
+def row(title, rank, category='Books'):
+    return {'Title': title, 'Sales Rank - Current': rank, 'Categories - Root': category}
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / 'deals.sqlite')
+    now = time.time()
+    old = DealStore(path, run_ts=now - 10 * DAY)
+    old.add(deal('A1', 100000), row('First', 100000))
+    old.add(deal('A2', 900000), row('Second', 900000))
+    old.finish(2, 2)
+    old.close()
+    new = DealStore(path, run_ts=now - DAY)
+    new.add(deal('A1', 200000, last_update=7100000), row('First again', 200000))
+    new.add(deal('A3', 400000, root_cat=1055398), row('Third', 400000, 'Home & Kitchen'))
+    # Reused row from an older run_state.json: the rank is a string, so it comes from the deal
+    new.add(deal('A4', 300000), row('Fourth', '300,000'))
+    new.finish(3, 3)
+    yield new
+    new.close()
+
+def test_latest_run_per_asin(store):
+    results = store.query()
+    assert sorted(r['asin'] for r in results) == ['A1', 'A2', 'A3', 'A4']
+    first = next(r for r in results if r['asin'] == 'A1')
+    assert first['row']['Title'] == 'First again' and first['sales_rank'] == 200000 and first['last_update'] == 7100000
+
+def test_category_rank_and_days(store):
+    # "Books under rank 500k seen in the last 7 days"
+    assert [r['asin'] for r in store.query(category='Books', max_rank=500000, days=7)] == ['A1', 'A4']
+    assert [r['asin'] for r in store.query(category=1055398)] == ['A3']
+    assert [r['asin'] for r in store.query(min_rank=500000)] == ['A2']
+    assert [r['asin'] for r in store.query(updated_since=7050000)] == ['A1']
+    assert len(store.query(limit=2)) == 2
+
+def test_history_oldest_first(store):
+    assert [r['row']['Title'] for r in store.history('A1')] == ['First', 'First again']
+    assert [r[2] for r in store.runs()] == [3, 2]
+
+def test_abort_drops_the_unfinished_run(tmp_path):
+    path = str(tmp_path / 'deals.sqlite')
+    done = DealStore(path, run_ts=1000.0)
+    done.add(deal('A1', 100), row('Kept', 100))
+    done.finish(1, 1)
+    done.close()
+    failed = DealStore(path, run_ts=2000.0)
+    failed.add(deal('A1', 200), row('Partial', 200))
+    failed._flush()
+    failed.abort()
+    check = DealStore(path)
+    assert [r['row']['Title'] for r in check.history('A1')] == ['Kept']
+    check.close()
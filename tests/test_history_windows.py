@@ -0,0 +1,92 @@
+import bisect
+import random
+import numpy as np
+import pytest
+from history import KEEPA_EPOCH, SHIPPING_SERIES, WINDOW_SPECS, SeriesIndex, window_columns, window_series
+
+NOW = 8000000
+
+# Per-segment reference: each value holds until the next timestamp, the last one until NOW; -1 is no data
+def ref_average(times, values, start):
+    total = covered = 0
+    for i, value in enumerate(values):
+        end = times[i + 1] if i + 1 < len(times) else NOW
+        overlap = max(min(end, NOW) - max(times[i], start), 0)
+        if value >= 0:
+            total += value * overlap
+            covered += overlap
+    return int(round(total / covered)) if covered else -1
+
+def ref_first_segment(times, start):
+    return max(bisect.bisect_right(times, start) - 1, 0)
+
+def ref_minimum(times, values, start):
+    valid = [v for v in values[ref_first_segment(times, start):] if v >= 0]
+    return min(valid) if times and valid else -1
+
+def ref_maximum(times, values, start):
+    valid = [v for v in values[ref_first_segment(times, start):] if v >= 0]
+    return max(valid) if times and valid else -1
+
+def ref_drops(times, values, start):
+    if not times:
+        return -1
+    return sum(1 for i in range(1, len(times)) if times[i] >= start and values[i] >= 0 and values[i - 1] >= 0 and values[i] < values[i - 1])
+
+def random_series(rng, points):
+    times = sorted(rng.sample(range(NOW - 400 * 1440, NOW), points))
+    values = [rng.choice([-1, rng.randint(0, 5000)]) if rng.random() < 0.2 else rng.randint(0, 5000) for _ in times]
+    return times, values
+
+def test_aggregates_match_reference():
+    rng = random.Random(7)
+    series = [random_series(rng, rng.choice([0, 1, 2, 5, 40, 300])) for _ in range(60)]
+    series.append(([NOW - 100 * 1440, NOW - 60 * 1440, NOW - 10], [10, 5, 3]))  # a point exactly at a window start
+    index = SeriesIndex([(np.array(t, dtype=np.int64), np.array(v, dtype=np.int64)) for t, v in series], NOW)
+    for days in (1, 60, 90, 180, 365, 500):
+        start = NOW - days * 1440
+        ids = np.arange(len(series))
+        starts = np.full(len(series), start)
+        got = {name: getattr(index, name)(ids, starts).tolist() for name in ('averages', 'minimums', 'maximums', 'drop_counts')}
+        for i, (times, values) in enumerate(series):
+            assert got['averages'][i] == ref_average(times, values, start)
+            assert got['minimums'][i] == ref_minimum(times, values, start)
+            assert got['maximums'][i] == ref_maximum(times, values, start)
+            assert got['drop_counts'][i] == ref_drops(times, values, start)
+
+def test_average_by_hand():
+    # 100 for 30 days, then 400 for the last 30 days of the window: average 250
+    times = [NOW - 90 * 1440, NOW - 30 * 1440]
+    index = SeriesIndex([(np.array(times), np.array([100, 400]))], NOW)
+    assert index.averages([0], [NOW - 60 * 1440]).tolist() == [250]
+    assert index.drop_counts([0], [NOW - 60 * 1440]).tolist() == [0]
+
+def flat(times, values, with_shipping):
+    raw = []
+    for t, v in zip(times, values):
+        raw += [t, v, 50] if with_shipping else [t, v]
+    return raw
+
+def test_window_columns_match_full_series():
+    rng = random.Random(11)
+    csv = [None] * 35
+    for _, index, *_ in WINDOW_SPECS:
+        times, values = random_series(rng, rng.choice([0, 3, 200]))
+        csv[index] = flat(times, values, index in SHIPPING_SERIES)
+    row = window_columns({'csv': csv}, now=NOW)
+    for header, index, days, aggregate, _, _ in WINDOW_SPECS:
+        raw = csv[index]
+        step = 3 if index in SHIPPING_SERIES else 2
+        times = raw[0::step]
+        values = [v if v < 0 else v + (raw[i * step + 2] if step == 3 else 0) for i, v in enumerate(raw[1::step])]
+        ref = {'average': ref_average, 'drops': ref_drops}[aggregate](times, values, NOW - days * 1440)
+        assert row[header] == (None if ref < 0 else ref), header
+
+@pytest.mark.parametrize('since_days', [0, 60, 1000])
+def test_window_series_keeps_the_segment_before_the_window(since_days):
+    times = [NOW - d * 1440 for d in (300, 200, 100, 50, 10)]
+    minutes, values = window_series(flat(times, [1, 2, 3, 4, 5], False), False, NOW - since_days * 1440)
+    kept = minutes.tolist()
+    # Everything from one point before the segment containing `since`
+    expected = {0: times[3:], 60: times[1:], 1000: times}[since_days]
+    assert kept == expected and values.tolist() == [1, 2, 3, 4, 5][len(times) - len(kept):]
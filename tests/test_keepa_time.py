@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+import pytz
+from keepa_time import KEEPA_EPOCH, TORONTO_TZ, format_keepa_minutes, local_minutes
+
+def keepa_minute(utc):
+    return int((utc - KEEPA_EPOCH).total_seconds() // 60)
+
+# Baseline: the per-value pytz conversion the columns used before the transition table
+def baseline(minutes, date_only=False):
+    if minutes <= 100000:
+        return '-'
+    local = pytz.utc.localize(KEEPA_EPOCH + timedelta(minutes=minutes)).astimezone(TORONTO_TZ)
+    return local.strftime('%Y-%m-%d' if date_only else '%Y-%m-%d %H:%M:%S')
+
+# UTC instants of Toronto DST changes: spring forward 2:00 EST, fall back 2:00 EDT
+TRANSITIONS = [datetime(2011, 3, 13, 7), datetime(2011, 11, 6, 6), datetime(2024, 3, 10, 7), datetime(2024, 11, 3, 6)]
+
+def test_local_minutes_across_dst_transitions():
+    for utc in TRANSITIONS:
+        minutes = list(range(keepa_minute(utc) - 120, keepa_minute(utc) + 120))
+        assert format_keepa_minutes(minutes) == [baseline(m) for m in minutes]
+
+def test_offsets_either_side_of_a_transition():
+    spring = keepa_minute(datetime(2024, 3, 10, 7))
+    assert (local_minutes([spring - 1, spring]) - [spring - 1, spring]).tolist() == [-300, -240]
+    fall = keepa_minute(datetime(2024, 11, 3, 6))
+    assert (local_minutes([fall - 1, fall]) - [fall - 1, fall]).tolist() == [-240, -300]
+
+def test_placeholders_and_date_only():
+    minutes = [0, -1, 100000, 100001, keepa_minute(datetime(2024, 11, 3, 3, 59))]
+    assert format_keepa_minutes(minutes) == [baseline(m) for m in minutes]
+    assert format_keepa_minutes(minutes, date_only=True) == [baseline(m, date_only=True) for m in minutes]
+    assert format_keepa_minutes(minutes, date_only=True)[-1] == '2024-11-02'
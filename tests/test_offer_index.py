@@ -0,0 +1,61 @@
+import random
+import numpy as np
+from history import KEEPA_EPOCH
+from offer_index import offer_index
+from stable_deals import MISSING
+from stable_products import new_3rd_party_fba_current, new_3rd_party_fbm_current
+
+# Baselines: the list comprehensions new_3rd_party_fba/fbm_current used before the offer index
+def baseline_fba_prices(product):
+    return [o.get('price', -1) / 100 for o in product.get('offers', []) if o.get('condition') == 'New' and o.get('isFBA', False)]
+
+def baseline_fbm_lowest(product):
+    prices = [o.get('price') for o in product.get('offers', []) if o.get('condition') == 'New' and o.get('isFBA', False) is False and o.get('price', -1) > 0]
+    return min(prices) if prices else MISSING
+
+def random_offers(rng, count):
+    offers = []
+    for _ in range(count):
+        offer = {'condition': rng.choice(['New', 'New', 'Used', 'Collectible', None])}
+        is_fba = rng.choice([True, False, None, 0, 1, 'absent'])
+        if is_fba != 'absent':
+            offer['isFBA'] = is_fba
+        if rng.random() < 0.9:
+            offer['price'] = rng.choice([-1, 0, rng.randint(1, 20000)])
+        offers.append(offer)
+    return offers
+
+def test_buckets_match_baseline():
+    rng = random.Random(5)
+    for _ in range(200):
+        product = {'offers': random_offers(rng, rng.randint(0, 30))}
+        index = offer_index(product)
+        assert [p / 100 for p in index.bucket('New', 'FBA').prices] == baseline_fba_prices(product)
+        assert index.bucket('New', 'FBM').min_price == baseline_fbm_lowest(product)
+        for condition in ('New', 'Used', 'Collectible', None):
+            matching = [o for o in product['offers'] if o.get('condition') == condition]
+            assert index.bucket(condition).offers == matching
+            assert index.bucket(condition).count == len(matching)
+
+def test_extractors_match_baseline():
+    rng = random.Random(9)
+    for _ in range(100):
+        offers = random_offers(rng, rng.randint(0, 20))
+        fba = baseline_fba_prices({'offers': offers})
+        current = round(rng.choice(fba + [1.23]) * 100) if fba and rng.random() < 0.7 else rng.choice([-1, 123])
+        product = {'asin': 'TEST', 'offers': offers, 'stats': {'current': [-1] * 11 + [current]}}
+        expected_fba = current if current != -1 and any(abs(float(f"{current / 100:.2f}") - p) < 0.01 for p in fba) else MISSING
+        assert new_3rd_party_fba_current(product) == {'New, 3rd Party FBA - Current': expected_fba}
+        assert new_3rd_party_fbm_current(dict(product)) == {'New, 3rd Party FBM - Current': baseline_fbm_lowest(product)}
+
+def test_missing_and_empty_offers():
+    assert offer_index({}).bucket('New', 'FBA').count == 0
+    assert offer_index({'offers': None}).bucket('Used').min_price is MISSING
+
+def test_offer_history_decoded_once():
+    offer = {'condition': 'Used', 'isFBA': False, 'price': 500, 'offerCSV': [7000000, 450, 50, 7000100, -1, -1, 7000200, 500, -1]}
+    index = offer_index({'offers': [offer]})
+    times, values = index.offer_history(offer)
+    assert ((times - KEEPA_EPOCH).astype(np.int64)).tolist() == [7000000, 7000100, 7000200]
+    assert values.tolist() == [500, -1, 500]
+    assert index.offer_history(offer) is index.offer_history(offer)
@@ -0,0 +1,70 @@
+import threading
+from token_scheduler import REFILL_INTERVAL, TokenScheduler, estimate_product_cost
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def scheduler_with(tokens_left, refill_in_ms, refill_rate):
+    clock = FakeClock()
+    scheduler = TokenScheduler(clock=clock, sleep=clock.sleep)
+    scheduler.update({'tokensLeft': tokens_left, 'refillIn': refill_in_ms, 'refillRate': refill_rate})
+    return scheduler, clock
+
+def test_estimate_product_cost():
+    # 1 per product, 6 per page of 10 offers, 2 for stock (with offers), 1 for rating
+    assert estimate_product_cost(100, offers=100, rating=1, stock=1) == 100 * (1 + 60 + 2 + 1)
+    assert estimate_product_cost(3) == 3
+
+def test_no_wait_before_first_response():
+    clock = FakeClock()
+    scheduler = TokenScheduler(clock=clock, sleep=clock.sleep)
+    scheduler.acquire(500)
+    assert clock.sleeps == [] and scheduler.tokens_left is None
+
+def test_spends_down_to_negative_without_waiting():
+    scheduler, clock = scheduler_with(10, 30000, 20)
+    scheduler.acquire(5)
+    scheduler.acquire(10)  # 5 left > 0, so it goes out and the budget turns negative
+    assert clock.sleeps == [] and scheduler.tokens_left == -5
+
+def test_waits_until_refill_then_rebases():
+    scheduler, clock = scheduler_with(-5, 30000, 20)
+    scheduler.acquire(1)
+    assert clock.sleeps == [30.0]
+    # One refill (+20) folded in, next refill a full interval later
+    assert scheduler.tokens_left == -5 + 20 - 1
+    assert scheduler.refill_at == 1000.0 + 30.0 + REFILL_INTERVAL
+    assert scheduler.waited == 30.0
+
+def test_waits_for_several_refills():
+    scheduler, clock = scheduler_with(-50, 10000, 20)
+    scheduler.acquire(1)
+    # floor(50 / 20) + 1 = 3 refills: 10s to the first, then two full intervals
+    assert clock.sleeps == [10.0 + 2 * REFILL_INTERVAL]
+    assert scheduler.tokens_left == -50 + 3 * 20 - 1
+
+def test_update_during_wait_is_applied():
+    scheduler, clock = scheduler_with(-5, 30000, 20)
+    done = []
+
+    def sleep(seconds):
+        # Another worker reports fresh tokens while this one waits; update() must not block
+        worker = threading.Thread(target=lambda: done.append(scheduler.update({'tokensLeft': 100, 'refillIn': 60000, 'refillRate': 20})))
+        worker.start()
+        worker.join(2)
+        assert done, "update() blocked behind acquire()"
+        clock.now += 1.0
+
+    scheduler._sleep = sleep
+    scheduler.acquire(10)
+    assert scheduler.tokens_left == 90
+    assert scheduler.waited == 30.0
@@ -0,0 +1,115 @@
+# token_scheduler.py
+# Shared Keepa token budget. Every Keepa response reports tokensLeft, refillIn (ms until the
+# next refill) and refillRate (tokens per minute). Requests go out back to back while the
+# estimated budget is positive and only wait for the exact refill time once it runs out.
+import logging
+import math
+import threading
+import time
+
+# Estimated token costs (Keepa API docs): 1 per product, +6 per page of 10 offers,
+# +1 for rating, +2 for stock; 5 per /deal page.
+PRODUCT_TOKEN_COST = 1
+OFFER_PAGE_TOKEN_COST = 6
+RATING_TOKEN_COST = 1
+STOCK_TOKEN_COST = 2
+DEAL_PAGE_TOKEN_COST = 5
+REFILL_INTERVAL = 60.0  # Keepa refills once per minute
+
+def estimate_product_cost(asin_count, offers=0, rating=0, stock=0, **unused):
+    per_product = PRODUCT_TOKEN_COST
+    if offers:
+        per_product += OFFER_PAGE_TOKEN_COST * math.ceil(int(offers) / 10)
+        if stock:
+            per_product += STOCK_TOKEN_COST
+    if rating:
+        per_product += RATING_TOKEN_COST
+    return per_product * asin_count
+
+def estimate_deal_cost(pages=1):
+    return DEAL_PAGE_TOKEN_COST * pages
+
+class TokenScheduler:
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._sleep = sleep
+        self.tokens_left = None  # Unknown until the first response
+        self.refill_rate = None
+        self.refill_at = None  # Monotonic time of the next refill
+        self.tokens_consumed = 0
+        self.waited = 0.0
+
+    # Tokens available at `now`, counting refills that happened since the last update
+    def _available(self, now):
+        if self.tokens_left is None or self.refill_rate is None or self.refill_at is None:
+            return None
+        if now < self.refill_at:
+            return self.tokens_left
+        refills = 1 + int((now - self.refill_at) // REFILL_INTERVAL)
+        return self.tokens_left + refills * self.refill_rate
+
+    # Seconds until the budget is positive again (0 if tokens are available now)
+    def _wait_time(self, now):
+        available = self._available(now)
+        if available is None or available > 0 or not self.refill_rate:
+            return 0.0
+        refills_needed = math.floor(-available / self.refill_rate) + 1
+        next_refill = self.refill_at
+        while next_refill <= now:
+            next_refill += REFILL_INTERVAL
+        return (next_refill - now) + (refills_needed - 1) * REFILL_INTERVAL
+
+    def acquire(self, cost):
+        # Reserve `cost` tokens, waiting for refills only when the budget is exhausted. The lock is
+        # not held while sleeping, so update() from other workers can bring in a newer
+        # tokensLeft/refillIn; the budget is checked again after every wait.
+        while True:
+            with self._lock:
+                now = self._clock()
+                wait = self._wait_time(now)
+                available = self._available(now)
+                if wait <= 0:
+                    if available is not None:
+                        self._rebase(now, available - cost)
+                    return
+            logging.info("Token budget exhausted (%s left), waiting %.1fs for refill", available, wait)
+            print(f"Waiting {wait:.1f}s for Keepa tokens...")
+            self._sleep(wait)
+            with self._lock:
+                self.waited += wait
+
+    def _rebase(self, now, tokens):
+        # Fold elapsed refills into tokens_left so refill_at is in the future
+        while self.refill_at is not None and self.refill_at <= now:
+            self.refill_at += REFILL_INTERVAL
+        self.tokens_left = tokens
+
+    def update(self, data):
+        # Sync with the tokensLeft/refillIn/refillRate fields of a Keepa response
+        if not isinstance(data, dict) or 'tokensLeft' not in data:
+            return
+        with self._lock:
+            now = self._clock()
+            self.tokens_left = data['tokensLeft']
+            if data.get('refillRate') is not None:
+                self.refill_rate = data['refillRate']
+            if data.get('refillIn') is not None:
+                self.refill_at = now + data['refillIn'] / 1000.0
+            self.tokens_consumed += data.get('tokensConsumed', 0) or 0
+            logging.debug("Token status: tokensLeft=%s, refillRate=%s, refillIn=%s", self.tokens_left, self.refill_rate, data.get('refillIn'))
+
+    def update_from_client(self, api):
+        # keepa.Keepa keeps the last status on the client (dict in older releases, object in newer)
+        status = getattr(api, 'status', None)
+        if status is not None and not isinstance(status, dict):
+            status = {k: getattr(status, k, None) for k in ('refillIn', 'refillRate')}
+        data = {'tokensLeft': getattr(api, 'tokens_left', None)}
+        if isinstance(status, dict):
+            data['refillIn'] = status.get('refillIn')
+            data['refillRate'] = status.get('refillRate')
+        if data['tokensLeft'] is not None:
+            self.update(data)
+
+# Module-level scheduler shared by every Keepa call site
+scheduler = TokenScheduler()